@@ -0,0 +1,451 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017-2019:
+#    Frederic Mohier, frederic.mohier@gmail.com
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module contains the asyncio import engine, it requires Python 3.5 or later.
+
+All the web services requests are sent from one thread, at most `concurrency` requests
+are in flight at the same time. The HTTP client is aiohttp if it is installed, else a
+minimal HTTP/1.1 client over the asyncio streams.
+"""
+import ssl
+import json
+import socket
+import time
+import zlib
+import asyncio
+import threading
+from urllib.parse import urlparse
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .transport import xc, TransferStats
+from .backends import json_query, add_page
+from .profiler import measure
+
+
+class StreamsClient(object):
+    """
+    Minimal HTTP/1.1 client over the asyncio streams
+
+    The connections are kept alive, at most `size` idle connections are kept. The read
+    timeout is the maximum duration of a response.
+    """
+    name = 'streams'
+
+    def __init__(self, uri, size=4, connect_timeout=None, read_timeout=None, context=None):
+        # pylint: disable=too-many-arguments
+        parsed = urlparse(uri)
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        self.netloc = parsed.netloc
+        self.size = size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.context = context
+        self._idle = []
+
+    async def _connect(self):
+        """Get an idle connection or open a new one
+
+        :return: ((reader, writer), reused)
+        """
+        if self._idle:
+            return self._idle.pop(), True
+        connection = asyncio.open_connection(
+            self.host, self.port, ssl=self.context,
+            server_hostname=self.host if self.context else None)
+        return (await asyncio.wait_for(connection, self.connect_timeout)), False
+
+    async def request(self, method, path, headers, body=None):
+        """Send a request and read the whole response
+
+        :return: (status, reason, headers, body, retried requests), the headers names are
+        lower case
+        """
+        retries = 0
+        while True:
+            (reader, writer), reused = await self._connect()
+            try:
+                response = await self._request(reader, writer, method, path, headers, body)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if not reused:
+                    raise
+                # The kept alive connection was closed by the server
+                retries += 1
+                continue
+            except BaseException:
+                writer.close()
+                raise
+
+            status, reason, response_headers, response_body, keep_alive = response
+            if keep_alive and len(self._idle) < self.size:
+                self._idle.append((reader, writer))
+            else:
+                writer.close()
+            return status, reason, response_headers, response_body, retries
+
+    async def _request(self, reader, writer, method, path, headers, body):
+        """Send a request on a connection"""
+        # pylint: disable=too-many-arguments
+        lines = ['%s %s HTTP/1.1' % (method, path), 'Host: %s' % self.netloc]
+        lines.extend('%s: %s' % header for header in headers.items())
+        if body is not None:
+            lines.append('Content-Length: %d' % len(body))
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + (body or b''))
+        await writer.drain()
+        return await asyncio.wait_for(self._read_response(reader), self.read_timeout)
+
+    @staticmethod
+    async def _read_response(reader):
+        """Read a response
+
+        :return: (status, reason, headers, body, keep alive)
+        """
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Connection closed by the server")
+        version, status, reason = (status_line.decode('latin-1').rstrip('\r\n')
+                                   .split(' ', 2) + [''])[:3]
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if not size:
+                    # Skip the trailer
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b''.join(chunks)
+        elif 'content-length' in headers:
+            body = await reader.readexactly(int(headers['content-length']))
+        else:
+            body = await reader.read()
+            keep_alive = False
+        return int(status), reason, headers, body, keep_alive
+
+    async def close(self):
+        """Close the idle connections"""
+        idle, self._idle = self._idle, []
+        for _, writer in idle:
+            writer.close()
+
+
+class AiohttpClient(object):
+    """HTTP client using aiohttp, at most `size` connections are open"""
+    name = 'aiohttp'
+
+    def __init__(self, uri, size=4, connect_timeout=None, read_timeout=None, context=None):
+        # pylint: disable=too-many-arguments
+        parsed = urlparse(uri)
+        self.base = '%s://%s' % (parsed.scheme, parsed.netloc)
+        self.size = size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.context = context
+        self.session = None
+
+    async def request(self, method, path, headers, body=None):
+        """Send a request and read the whole response
+
+        :return: (status, reason, headers, body, retried requests), the headers names are
+        lower case
+        """
+        if self.session is None:
+            # The session must be created in the event loop
+            connector = aiohttp.TCPConnector(limit_per_host=self.size,
+                                             **({'ssl': self.context} if self.context else {}))
+            timeout = aiohttp.ClientTimeout(total=None, connect=self.connect_timeout,
+                                            sock_read=self.read_timeout)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                                 auto_decompress=False)
+        async with self.session.request(method, self.base + path, data=body,
+                                        headers=headers) as response:
+            response_body = await response.read()
+            return (response.status, response.reason,
+                    dict((name.lower(), value) for name, value in response.headers.items()),
+                    response_body, 0)
+
+    async def close(self):
+        """Close the connections"""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+class AsyncBackend(object):
+    """
+    Glpi web services requested with asyncio
+
+    `call` requests one web service and `fetch` requests several web services
+    concurrently. The backend has its own event loop, it may be used by one thread at
+    a time.
+    """
+    name = 'asyncio'
+
+    def __init__(self, uri, backend='xmlrpc', concurrency=16, http='auto', pool_size=4,
+                 connect_timeout=None, read_timeout=None, encoding='utf-8', verbose=False,
+                 gzip=True, gzip_threshold=None):
+        # pylint: disable=too-many-arguments
+        if backend not in ['xmlrpc', 'json']:
+            raise ValueError("Unknown backend '%s', available backends: json, xmlrpc"
+                             % backend)
+        if http == 'aiohttp' and aiohttp is None:
+            raise ValueError("aiohttp is not installed")
+        self.uri = uri
+        self.backend = backend
+        self.concurrency = concurrency
+        self.encoding = encoding
+        self.verbose = verbose
+        self.gzip = gzip
+        self.gzip_threshold = gzip_threshold
+        self.path = urlparse(uri).path or '/'
+        self.stats = TransferStats()
+        # ImportProfile measuring the responses parsing
+        self.profile = None
+        # RetryPolicy and CircuitBreaker of the fetched requests
+        self.retry_policy = None
+        self.breaker = None
+        # Called with (method, objects count, page size) when Glpi does not paginate a
+        # paginated web service
+        self.on_unpaginated = None
+
+        context = ssl.create_default_context() if uri.startswith('https:') else None
+        if http == 'aiohttp' or (http == 'auto' and aiohttp):
+            # The aiohttp connector limits the connections in use, not only the idle ones
+            self.client = AiohttpClient(uri, max(pool_size, concurrency), connect_timeout,
+                                        read_timeout, context)
+        else:
+            self.client = StreamsClient(uri, pool_size, connect_timeout, read_timeout,
+                                        context)
+
+        # Created on the first request and closed with the connections
+        self.loop = None
+        self._lock = threading.Lock()
+        self._semaphore = None
+
+    def _run(self, coroutine):
+        """Run a coroutine in the backend event loop"""
+        with self._lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+            return self.loop.run_until_complete(coroutine)
+
+    def call(self, method, parameters, timeout=None):
+        """Request a web service
+
+        :param method: web service method name
+        :param parameters: web service parameters
+        :param timeout: maximum duration of the response, not bounded if not set
+        :return: web service response
+        """
+        return self._run(self.request(method, parameters, timeout))[0]
+
+    def fetch(self, requests, timeout=None):
+        """Request several web services concurrently
+
+        A paginated web service is requested page after page until a page is not full.
+        The requests failing on a transient error are retried with the retry_policy and
+        they are not sent while the breaker is open.
+
+        :param requests: list of (method, parameters, page size, timeout) tuples, page size
+        is 0 to get all the objects in one request and timeout is the maximum duration of
+        each response, None to not bound it
+        :param timeout: maximum duration of the requests, the pending requests are then
+        cancelled. The response of the timed out requests is a socket.timeout
+        :return: list of (response or exception, duration, received bytes, retried
+        requests) tuples in the requests order
+        """
+        return self._run(self._fetch_all(requests, timeout))
+
+    def close(self):
+        """Close the connections and the event loop
+
+        A new event loop is created for the next requests.
+        """
+        with self._lock:
+            if self.loop is None:
+                return
+            try:
+                self.loop.run_until_complete(self.client.close())
+            finally:
+                self.loop.close()
+                self.loop = None
+                self._semaphore = None
+
+    async def request(self, method, parameters, timeout=None):
+        """Request a web service
+
+        Raise socket.timeout if the response is not received in timeout seconds, the
+        time waiting for a free request slot is not counted. Raise CircuitOpenError if
+        the breaker is open when the request gets a slot.
+
+        :return: (web service response, received bytes, retried requests)
+        """
+        if self._semaphore is None:
+            # Bounds the requests in flight to the Glpi endpoint
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        headers = {'Accept-Encoding': 'gzip' if self.gzip else 'identity'}
+        async with self._semaphore:
+            if self.breaker is not None:
+                self.breaker.before()
+            try:
+                response = await asyncio.wait_for(self._send(method, parameters, headers),
+                                                  timeout)
+            except asyncio.TimeoutError as exp:
+                raise socket.timeout("No response in %s seconds" % timeout) from exp
+
+        status, reason, response_headers, body, retries = response
+        if retries:
+            self.stats.retry(retries)
+        if status != 200:
+            raise xc.ProtocolError(self.uri, status, reason, response_headers)
+        return self._decode(body, response_headers), len(body), retries
+
+    async def _send(self, method, parameters, headers):
+        """Send a request with the HTTP client"""
+        if self.backend == 'json':
+            headers['Accept'] = 'application/json'
+            return await self.client.request(
+                'GET', json_query(self.path, method, parameters, self.encoding), headers)
+
+        headers['Content-Type'] = 'text/xml'
+        body = xc.dumps((parameters, ), method, encoding=self.encoding).encode(self.encoding)
+        if self.gzip_threshold and len(body) > self.gzip_threshold:
+            headers['Content-Encoding'] = 'gzip'
+            body = xc.gzip_encode(body)
+        return await self.client.request('POST', self.path, headers, body)
+
+    async def _attempt(self, method, parameters, timeout):
+        """Request a web service and retry it on transient errors
+
+        :return: (web service response, received bytes, retried requests)
+        """
+        attempt = 0
+        while True:
+            try:
+                response, received, retries = await self.request(method, parameters, timeout)
+            except asyncio.CancelledError:  # pylint: disable=try-except-raise
+                # An Exception before Python 3.8, the cancelled requests are not retried
+                raise
+            except Exception as exp:  # pylint: disable=broad-except
+                if self.breaker is not None:
+                    self.breaker.record(exp)
+                    if self.breaker.state == self.breaker.OPEN:
+                        raise
+                delay = None
+                if self.retry_policy is not None:
+                    delay = self.retry_policy.retry_delay(exp, attempt)
+                if delay is None:
+                    raise
+                self.stats.retry()
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+
+            if self.breaker is not None:
+                self.breaker.record()
+            return response, received, retries + attempt
+
+    def _decode(self, body, headers):
+        """Decompress and unmarshall a response"""
+        received = len(body)
+        decompress_time = 0.0
+        if headers.get('content-encoding', '') == 'gzip':
+            start = time.time()
+            with measure(self.profile, 'decompression'):
+                body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+            decompress_time = time.time() - start
+        self.stats.add(received, len(body), decompress_time)
+        if self.verbose:
+            print("body: %r" % body)
+
+        with measure(self.profile, 'unmarshalling'):
+            if self.backend == 'json':
+                result = json.loads(body.decode(self.encoding))
+                if isinstance(result, dict) and 'faultCode' in result:
+                    raise xc.Fault(result['faultCode'], result.get('faultString', ''))
+                return result
+            return xc.loads(body)[0][0]
+
+    async def _fetch(self, method, parameters, page_size, timeout=None):
+        """Request a web service, page after page if page_size is set
+
+        :return: (response or exception, duration, received bytes, retried requests)
+        """
+        start = time.time()
+        received = retries = 0
+        try:
+            if not page_size:
+                items, received, retries = await self._attempt(method, parameters, timeout)
+                return items, time.time() - start, received, retries
+
+            items = []
+            previous = None
+            while True:
+                page, size, page_retries = await self._attempt(
+                    method, dict(parameters, start=len(items), limit=page_size), timeout)
+                page = page or []
+                received += size
+                retries += page_retries
+                status = add_page(items, page, previous, page_size)
+                if status != 'next':
+                    if status == 'unpaginated' and self.on_unpaginated is not None:
+                        self.on_unpaginated(method, len(items), page_size)
+                    return items, time.time() - start, received, retries
+                previous = page
+        except asyncio.CancelledError:  # pylint: disable=try-except-raise
+            # An Exception before Python 3.8, the cancelled requests are not failed
+            raise
+        except Exception as exp:  # pylint: disable=broad-except
+            return exp, time.time() - start, received, retries
+
+    async def _fetch_all(self, requests, timeout):
+        """Request several web services concurrently, see fetch"""
+        start = time.time()
+        tasks = [asyncio.ensure_future(self._fetch(*request)) for request in requests]
+        if not tasks:
+            return []
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+
+        return [(socket.timeout("Not completed in %s seconds" % timeout),
+                 time.time() - start, 0, 0) if task in pending else task.result()
+                for task in tasks]
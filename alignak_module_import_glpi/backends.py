@@ -0,0 +1,315 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017-2019:
+#    Frederic Mohier, frederic.mohier@gmail.com
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module contains the backends used to request the Glpi web services:
+- xmlrpc: the XML-RPC endpoint (plugins/webservices/xmlrpc.php)
+- json: the REST endpoint returning JSON data (plugins/webservices/rest.php)
+
+Both backends raise the XML-RPC Fault and ProtocolError exceptions on errors.
+"""
+import ssl
+import json
+import socket
+
+from six import text_type
+from six.moves.urllib.parse import urlencode, urlparse
+
+from .transport import (xc, ConnectionPool, TransferStats, TlsSessions, read_response,
+                        GlpiTransport, GlpiSafeTransport, set_read_timeout,
+                        TimeoutHTTPConnection, TimeoutHTTPSConnection)
+from .profiler import measure
+
+try:
+    from httplib import HTTPException
+except ImportError:
+    from http.client import HTTPException
+
+
+class GlpiBackend(object):
+    """
+    Base class of the Glpi web services backends
+
+    A backend requests the web services with the connections of its pool.
+    """
+    name = None
+
+    def __init__(self, uri, pool_size=4, connect_timeout=None, read_timeout=None,
+                 encoding='utf-8', verbose=False, gzip=True, gzip_threshold=None):
+        # pylint: disable=too-many-arguments
+        self.uri = uri
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.encoding = encoding
+        self.verbose = verbose
+        # Request compressed responses
+        self.gzip = gzip
+        # Compress the requests bigger than this size
+        self.gzip_threshold = gzip_threshold
+        self.stats = TransferStats()
+        # ImportProfile measuring the responses parsing
+        self.profile = None
+
+        # Shared by all the HTTPS connections to resume the TLS sessions
+        self.context = None
+        self.tls_sessions = None
+        if uri.startswith('https:'):
+            self.context = ssl.create_default_context()
+            self.tls_sessions = TlsSessions()
+
+        self.pool = ConnectionPool(self.new_connection, pool_size)
+
+    def new_connection(self):
+        """Open a new connection to the web services"""
+        raise NotImplementedError()
+
+    def call(self, method, parameters, timeout=None):
+        """Request a web service
+
+        :param method: web service method name
+        :param parameters: web service parameters
+        :param timeout: read timeout of this request, the backend read_timeout if not set
+        :return: web service response
+        """
+        raise NotImplementedError()
+
+    def multicall(self, calls, timeout=None):
+        """Request several web services in one request
+
+        Raise NotImplementedError if the backend does not support it.
+
+        :param calls: list of (method, parameters) tuples
+        :param timeout: read timeout of this request, the backend read_timeout if not set
+        :return: list of the web services responses, a Fault for the failed calls
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """Close the idle connections"""
+        self.pool.close()
+
+
+class XmlRpcBackend(GlpiBackend):
+    """Glpi XML-RPC web services"""
+    name = 'xmlrpc'
+
+    def new_connection(self):
+        """Create a transport that keeps its HTTP connection alive
+
+        :return: XML-RPC transport
+        """
+        if self.context is not None:
+            transport = GlpiSafeTransport(self.connect_timeout, self.read_timeout,
+                                          context=self.context,
+                                          tls_sessions=self.tls_sessions)
+        else:
+            transport = GlpiTransport(self.connect_timeout, self.read_timeout)
+        transport.accept_gzip_encoding = self.gzip
+        transport.encode_threshold = self.gzip_threshold
+        transport.stats = self.stats
+        return transport
+
+    def call(self, method, parameters, timeout=None):
+        """Request a web service
+
+        :param method: web service method name
+        :param parameters: web service parameters
+        :param timeout: read timeout of this request, the backend read_timeout if not set
+        :return: web service response
+        """
+        with self.pool.connection() as transport:
+            transport.profile = self.profile
+            transport.call_timeout = timeout
+            proxy = xc.ServerProxy(self.uri, transport=transport,
+                                   encoding=self.encoding, verbose=self.verbose)
+            return getattr(proxy, method)(parameters)
+
+    def multicall(self, calls, timeout=None):
+        """Request several web services in one system.multicall request
+
+        Raise a Fault if the server does not support system.multicall.
+
+        :param calls: list of (method, parameters) tuples
+        :param timeout: read timeout of this request, the backend read_timeout if not set
+        :return: list of the web services responses, a Fault for the failed calls
+        """
+        with self.pool.connection() as transport:
+            transport.profile = self.profile
+            transport.call_timeout = timeout
+            proxy = xc.ServerProxy(self.uri, transport=transport,
+                                   encoding=self.encoding, verbose=self.verbose)
+            multicall = xc.MultiCall(proxy)
+            for method, parameters in calls:
+                getattr(multicall, method)(parameters)
+            results = multicall()
+
+        responses = []
+        for idx in range(len(calls)):
+            try:
+                responses.append(results[idx])
+            except xc.Fault as exp:
+                responses.append(exp)
+        return responses
+
+
+class JsonBackend(GlpiBackend):
+    """Glpi REST web services returning JSON data
+
+    The method and its parameters are sent in the query string.
+    """
+    name = 'json'
+
+    def __init__(self, uri, *args, **kwargs):
+        GlpiBackend.__init__(self, uri, *args, **kwargs)
+        parsed = urlparse(uri)
+        self.host = parsed.netloc
+        self.path = parsed.path or '/'
+
+    def new_connection(self):
+        """Create an HTTP connection that is kept alive
+
+        :return: HTTP connection
+        """
+        parameters = {'read_timeout': self.read_timeout}
+        if self.connect_timeout:
+            parameters['timeout'] = self.connect_timeout
+        if self.context is not None:
+            return TimeoutHTTPSConnection(self.host, context=self.context,
+                                          tls_sessions=self.tls_sessions, **parameters)
+        return TimeoutHTTPConnection(self.host, **parameters)
+
+    def _query(self, method, parameters):
+        """Build the request query string"""
+        return json_query(self.path, method, parameters, self.encoding)
+
+    def _request(self, con, url, timeout=None):
+        """Send a request and read the whole response
+
+        :return: (HTTP response, response body)
+        """
+        set_read_timeout(con, timeout or self.read_timeout)
+        headers = {
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip' if self.gzip else 'identity'
+        }
+        con.request('GET', url, headers=headers)
+        response = con.getresponse()
+        body = []
+        read_response(response, body.append, self.stats, profile=self.profile)
+        return response, b''.join(body)
+
+    def call(self, method, parameters, timeout=None):
+        """Request a web service
+
+        :param method: web service method name
+        :param parameters: web service parameters
+        :param timeout: read timeout of this request, the backend read_timeout if not set
+        :return: web service response
+        """
+        url = self._query(method, parameters)
+        with self.pool.connection() as con:
+            try:
+                response, body = self._request(con, url, timeout)
+            except socket.timeout:
+                raise
+            except (socket.error, HTTPException):
+                # The kept alive connection may have been closed by the server
+                con.close()
+                self.stats.retry()
+                response, body = self._request(con, url, timeout)
+
+        if self.verbose:
+            print("body: %r" % body)
+        if response.status != 200:
+            raise xc.ProtocolError(self.uri, response.status, response.reason,
+                                   dict(response.getheaders()))
+
+        with measure(self.profile, 'unmarshalling'):
+            result = json.loads(body.decode(self.encoding))
+        if isinstance(result, dict) and 'faultCode' in result:
+            raise xc.Fault(result['faultCode'], result.get('faultString', ''))
+        return result
+
+    def multicall(self, calls, timeout=None):
+        """The JSON web services do not have a system.multicall request
+
+        Raise NotImplementedError, multicall is only available with the xmlrpc backend.
+        """
+        raise NotImplementedError("multicall is not available with the json backend")
+
+
+def json_query(path, method, parameters, encoding='utf-8'):
+    """Build the query string of a JSON web service request
+
+    :param path: web services path
+    :param method: web service method name
+    :param parameters: web service parameters
+    :param encoding: parameters encoding
+    :return: path and query string
+    """
+    query = [('method', method)]
+    for key in sorted(parameters):
+        value = parameters[key]
+        if isinstance(value, text_type):
+            value = value.encode(encoding)
+        query.append((key, value))
+    return '%s?%s' % (path, urlencode(query))
+
+
+def add_page(items, page, previous, page_size):
+    """Add a page of a paginated web service to the items of the previous pages
+
+    The last page is not full. A page bigger than the limit or equal to the previous page
+    means that Glpi does not paginate the web service (the start and limit parameters
+    are ignored): the first page has all the objects and the next pages are dropped.
+
+    :param items: items of the previous pages, extended with the page items
+    :param page: items of the page
+    :param previous: items of the previous page, None for the first page
+    :param page_size: requested objects count (limit)
+    :return: 'next' if the next page must be requested, 'last' for the last page,
+    'unpaginated' if Glpi does not paginate the web service
+    """
+    if len(page) > page_size or (previous is not None and page and page == previous):
+        if not items:
+            items.extend(page)
+        return 'unpaginated'
+    items.extend(page)
+    return 'last' if len(page) < page_size else 'next'
+
+
+BACKENDS = {
+    XmlRpcBackend.name: XmlRpcBackend,
+    JsonBackend.name: JsonBackend
+}
+
+
+def get_backend(name, uri, **kwargs):
+    """Get a backend instance
+
+    :param name: backend name, one of BACKENDS
+    :param uri: web services uri
+    :return: backend instance
+    """
+    if name not in BACKENDS:
+        raise ValueError("Unknown backend '%s', available backends: %s"
+                         % (name, ', '.join(sorted(BACKENDS))))
+    return BACKENDS[name](uri, **kwargs)
@@ -0,0 +1,176 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017-2019:
+#    Frederic Mohier, frederic.mohier@gmail.com
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module detects the changes of the configuration imported from Glpi.
+
+The imported objects are hashed per entity and per object type. The hash does not
+depend on the objects order nor on the volatile properties (eg. modification date).
+
+The objects of two imports are compared to report the added, removed and modified
+objects with their modified properties.
+"""
+import os
+import json
+import hashlib
+
+
+def canonical_item(item, volatile=()):
+    """Get the canonical representation of an object
+
+    :param item: object properties
+    :param volatile: properties ignored in the representation
+    :return: JSON string with sorted keys
+    """
+    item = dict((key, value) for key, value in item.items() if key not in volatile)
+    return json.dumps(item, sort_keys=True, default=str)
+
+
+def content_hash(items, volatile=()):
+    """Get the hash of a list of objects
+
+    :param items: list of objects
+    :param volatile: properties ignored in the hash
+    :return: hexadecimal hash
+    """
+    digest = hashlib.sha1()
+    for canonical in sorted(canonical_item(item, volatile) for item in items):
+        digest.update(canonical.encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def content_hashes(fetched, volatile=()):
+    """Get the hashes of the objects of each entity
+
+    :param fetched: list of (entity, objects) tuples, objects is a list of (ws, items) tuples
+    :param volatile: properties ignored in the hashes
+    :return: {entity: {object type: (hash, objects count)}}
+    """
+    hashes = {}
+    for entity, objects in fetched:
+        hashes[entity] = dict((ws['type'], (content_hash(items or [], volatile),
+                                            len(items or [])))
+                              for ws, items in objects)
+    return hashes
+
+
+def compare_hashes(previous, hashes):
+    """Compare the hashes of two imports
+
+    An entity that is added or removed changes all its object types.
+
+    :param previous: hashes of the previous import, as returned by content_hashes
+    :param hashes: hashes of the current import
+    :return: {object type: {'changed': bool, 'entities': [changed entities],
+    'count': objects count, 'previous_count': previous objects count}}
+    """
+    summary = {}
+    for entity in sorted(set(previous) | set(hashes)):
+        before = previous.get(entity, {})
+        after = hashes.get(entity, {})
+        for object_type in set(before) | set(after):
+            type_summary = summary.setdefault(object_type, {
+                'changed': False, 'entities': [], 'count': 0, 'previous_count': 0
+            })
+            type_summary['count'] += after.get(object_type, (None, 0))[1]
+            type_summary['previous_count'] += before.get(object_type, (None, 0))[1]
+            if before.get(object_type, (None, 0))[0] != after.get(object_type, (None, 0))[0]:
+                type_summary['changed'] = True
+                type_summary['entities'].append(entity)
+    return summary
+
+
+def diff_fields(previous, item, volatile=()):
+    """Get the modified properties of an object
+
+    :param previous: previous object properties
+    :param item: object properties
+    :param volatile: properties ignored in the comparison
+    :return: {property: [previous value, value]}, a missing value is None
+    """
+    changes = {}
+    for field in set(previous) | set(item):
+        if field in volatile:
+            continue
+        if previous.get(field) != item.get(field):
+            changes[field] = [previous.get(field), item.get(field)]
+    return changes
+
+
+def diff_objects(previous, objects, key, volatile=()):
+    """Compare the objects of two imports
+
+    The objects are identified by their name and indexed per object type, so the
+    comparison time is linear with the objects count.
+
+    :param previous: previous objects per type, as returned by get_objects
+    :param objects: objects per type
+    :param key: callable(object type, item) returning the object name
+    :param volatile: properties ignored in the comparison
+    :return: {object type: {'added': [names], 'removed': [names],
+    'modified': [{'name': name, 'changes': {property: [previous value, value]}}]}}
+    for the object types that changed
+    """
+    diff = {}
+    for object_type in sorted(set(previous) | set(objects)):
+        before = dict((key(object_type, item), item) for item in previous.get(object_type, []))
+        after = [(key(object_type, item), item) for item in objects.get(object_type, [])]
+        names = set(name for name, _ in after)
+
+        added = []
+        modified = []
+        for name, item in after:
+            if name not in before:
+                added.append(name)
+            elif before[name] != item:
+                changes = diff_fields(before[name], item, volatile)
+                if changes:
+                    modified.append({'name': name, 'changes': changes})
+        removed = [name for name in before if name not in names]
+
+        if added or removed or modified:
+            diff[object_type] = {'added': added, 'removed': sorted(removed),
+                                 'modified': modified}
+    return diff
+
+
+def write_report(path, report):
+    """Write a JSON report
+
+    The file is written atomically to never leave a partial report. Raise an
+    IOError if the report file cannot be written.
+
+    :param path: report file path
+    :param report: report content
+    :return: None
+    """
+    temp_path = '%s.%d.tmp' % (path, os.getpid())
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    try:
+        with open(temp_path, 'w') as fp:
+            json.dump(report, fp, default=str, separators=(',', ':'), sort_keys=True)
+        os.rename(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
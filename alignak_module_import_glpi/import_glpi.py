@@ -32,10 +32,18 @@
 This Class is a plugin for the Shinken/Alignak Arbiter. It connects to a Glpi instance
 with the Web services plugin installed to get all hosts and configuration.
 """
-import sys
+import os
+import re
 import time
+import socket
+import tempfile
 import logging
+import threading
 import traceback
+from collections import deque
+from functools import partial
+from multiprocessing import TimeoutError as PoolTimeoutError
+from multiprocessing.pool import ThreadPool
 
 try:
     import xmlrpclib as xc
@@ -43,6 +51,16 @@ except ImportError:
     import xmlrpc.client as xc
 
 from alignak.basemodule import BaseModule
+from alignak.stats import Stats
+
+from .snapshot import GlpiSnapshot
+from .changes import (content_hashes, compare_hashes, canonical_item, diff_objects,
+                      write_report)
+from .profiler import ImportProfile, measure
+from .retry import RetryPolicy, CircuitBreaker, CircuitOpenError
+from .session import SessionStore, is_session_expired, session_pattern
+from .records import RecordType, to_dict
+from .backends import get_backend, add_page
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 for handler in logger.parent.handlers:
@@ -94,6 +112,14 @@ class GlpiConfiguration(BaseModule):
         logger.debug("inner properties: %s", self.__dict__)
         logger.debug("received configuration: %s", mod_conf.__dict__)
 
+        # Internal statistics
+        self.statsmgr = Stats()
+        self.statsmgr.register(self.alias, 'module',
+                               statsd_host=getattr(mod_conf, 'statsd_host', 'localhost'),
+                               statsd_port=int(getattr(mod_conf, 'statsd_port', '8125')),
+                               statsd_prefix=getattr(mod_conf, 'statsd_prefix', 'alignak'),
+                               statsd_enabled=(getattr(mod_conf, 'statsd_enabled', '0') != '0'))
+
         self.alignak_name = getattr(mod_conf, 'alignak_name', '')
         self.uri = getattr(mod_conf, 'uri', '')
         logger.info("configured GLPI uri: %s", self.uri)
@@ -104,6 +130,19 @@ class GlpiConfiguration(BaseModule):
 
         self.login_name = getattr(mod_conf, 'login_name', 'alignak')
         self.login_password = getattr(mod_conf, 'login_password', 'alignak')
+        # Faults of the requests sent with an expired session, a new session is opened
+        # and the request is sent again
+        self.session_expired = session_pattern(
+            getattr(mod_conf, 'session_expired_fault', 'not authenticated'))
+        # Session stored to be reused by the next module instance
+        self.session_store = None
+        session_file = getattr(mod_conf, 'session_file', '')
+        if session_file:
+            self.session_store = SessionStore(session_file, getattr(mod_conf, 'uri', ''),
+                                              self.login_name,
+                                              int(getattr(mod_conf, 'session_ttl', '1440')))
+            logger.info("configured session file: %s, ttl: %d seconds",
+                        session_file, self.session_store.ttl)
 
         # Note that order matters! Get time periods and contacts after all other objects
         self.ws = [
@@ -150,6 +189,25 @@ class GlpiConfiguration(BaseModule):
             }
         ]
 
+        # Parameter used to request only the objects modified since the last import
+        for ws in self.ws:
+            ws['since'] = getattr(mod_conf, 'ws_%s_since' % ws['type'], 'since')
+
+        # Number of objects per page, 0 to get all the objects in one request
+        for ws in self.ws:
+            ws['page_size'] = int(getattr(mod_conf, 'ws_%s_page_size' % ws['type'], '0'))
+        # Read timeout per object type, 0 for the read_timeout
+        for ws in self.ws:
+            ws['timeout'] = float(getattr(mod_conf, 'ws_%s_timeout' % ws['type'], '0')) or None
+        # Compact records of the imported objects, converted to dictionaries when the
+        # objects are provided to the arbiter
+        for ws in self.ws:
+            ws['records'] = RecordType(ws['type'])
+        # Number of pages requested concurrently
+        self.page_prefetch = int(getattr(mod_conf, 'page_prefetch', '2'))
+        if self.page_prefetch < 1:
+            self.page_prefetch = 1
+
         # tag is the monitoring framework identifier
         self.tag = getattr(mod_conf, 'tag', '')
         if not self.tag:
@@ -161,9 +219,216 @@ class GlpiConfiguration(BaseModule):
             self.entities = []
         logger.info("configured entities tags: %s", self.entities)
 
+        # Number of entities that are fetched concurrently
+        self.max_workers = int(getattr(mod_conf, 'max_workers', '1'))
+        if self.max_workers < 1:
+            self.max_workers = 1
+        logger.info("configured workers: %d", self.max_workers)
+
+        # Request the web services of an entity concurrently
+        self.concurrent_calls = (getattr(mod_conf, 'concurrent_calls', '0') == '1')
+        logger.info("concurrent web services calls: %s", self.concurrent_calls)
+
+        # Snapshot of the imported configuration
+        self.snapshot = None
+        self.cache_dir = getattr(mod_conf, 'cache_dir', '')
+        self.cache_ttl = int(getattr(mod_conf, 'cache_ttl', '300'))
+        if self.cache_dir:
+            self.snapshot = GlpiSnapshot(self.cache_dir, self.uri, self.tag, self.alignak_name)
+            logger.info("configured snapshot: %s, ttl: %d seconds",
+                        self.snapshot.path, self.cache_ttl)
+
+        # External mode: the module process refreshes the snapshot periodically and the
+        # arbiter configuration is loaded from the snapshot
+        self.refresh_period = int(getattr(mod_conf, 'refresh_period', '60'))
+        if getattr(mod_conf, 'external', '0') == '1':
+            if self.snapshot:
+                self.is_external = True
+                logger.info("external module, snapshot refreshed every %d seconds",
+                            self.refresh_period)
+            else:
+                logger.warning("The external mode requires a snapshot directory (cache_dir), "
+                               "the configuration is imported when the arbiter loads it")
+        self._refreshed = 0
+
+        # Maximum time the arbiter waits for the import before getting the last snapshot,
+        # the import goes on in the background
+        self.fetch_deadline = int(getattr(mod_conf, 'fetch_deadline', '0'))
+        if self.fetch_deadline:
+            logger.info("configured fetch deadline: %d seconds", self.fetch_deadline)
+        # Import going on in the background after the fetch deadline
+        self._background = None
+        # Maximum duration of the Glpi requests, the requests that are not complete are
+        # abandoned and the import provides the objects it got
+        self.import_deadline = int(getattr(mod_conf, 'import_deadline', '0'))
+        if self.import_deadline:
+            logger.info("configured import deadline: %d seconds", self.import_deadline)
+        self._deadline = None
+        # Timed out requests of the last import: [(entity, object type)]
+        self.timeouts = []
+
+        # Merged objects logs: all the objects or a sample of each type with the counters
+        self.log_items = getattr(mod_conf, 'log_items', 'sample')
+        if self.log_items not in ['all', 'sample']:
+            logger.warning("Invalid log_items '%s', using 'sample'", self.log_items)
+            self.log_items = 'sample'
+        self.log_sample = int(getattr(mod_conf, 'log_sample', '3'))
+
+        # Duplicate objects policy: first, last or merge
+        self.duplicates = getattr(mod_conf, 'duplicates', 'first')
+        if self.duplicates not in ['first', 'last', 'merge']:
+            logger.warning("Invalid duplicates policy '%s', using 'first'", self.duplicates)
+            self.duplicates = 'first'
+        logger.info("duplicate objects policy: %s", self.duplicates)
+
+        # Incremental import
+        self.incremental = (getattr(mod_conf, 'incremental', '0') == '1')
+        self.incremental_full_period = int(getattr(mod_conf, 'incremental_full_period', '86400'))
+        if self.incremental:
+            logger.info("incremental import, full import every %d seconds",
+                        self.incremental_full_period)
+        # Objects types to get incrementally per entity: {entity: {type: since}}
+        self._delta = {}
+
+        # Change detection: objects hashes per entity and type of the last import, the
+        # volatile properties are ignored
+        self.change_detection = (getattr(mod_conf, 'change_detection', '0') == '1')
+        self.volatile_fields = [field.strip() for field in
+                                getattr(mod_conf, 'volatile_fields', 'date_mod').split(',')
+                                if field.strip()]
+        # Changes summary file, next to the snapshot by default
+        self.changes_file = getattr(mod_conf, 'changes_file', '')
+        if self.change_detection:
+            if not self.changes_file and self.snapshot:
+                self.changes_file = re.sub(r'\.json$', '', self.snapshot.path) + '-changes.json'
+            logger.info("change detection, ignored properties: %s, changes file: %s",
+                        ', '.join(self.volatile_fields), self.changes_file or 'none')
+        self.content_hashes = None
+        # Configuration changed since the last import, None if unknown
+        self.changed = None
+        # Changes summary per object type, see changes.compare_hashes
+        self.changes = {}
+        # JSON report of the changes between two imports
+        self.diff_report = getattr(mod_conf, 'diff_report', '')
+        if self.diff_report:
+            logger.info("configured changes report: %s", self.diff_report)
+        # Objects provided on the last import, to be compared with the next import
+        self.last_objects = None
+        self.diff = {}
+
+        # Import profiling, also enabled with the ALIGNAK_GLPI_PROFILE environment variable
+        # that may be set with the report path
+        self.profiling = (getattr(mod_conf, 'profile', '0') == '1')
+        self.profile_report = getattr(mod_conf, 'profile_report', '')
+        environment = os.environ.get('ALIGNAK_GLPI_PROFILE', '')
+        if environment not in ['', '0']:
+            self.profiling = True
+            if environment != '1':
+                self.profile_report = environment
+        if not self.profile_report:
+            self.profile_report = os.path.join(tempfile.gettempdir(),
+                                               'alignak-module-import-glpi-profile')
+        if self.profiling:
+            logger.info("import profiling, report: %s.json / .txt", self.profile_report)
+        # Profile of the running import and report of the last profiled import
+        self._profile = None
+        self.last_profile = None
+
         # Server connection
         self.con = None
         self.session = None
+        self._session_lock = threading.Lock()
+
+        # Web services backend: xmlrpc or json
+        self.backend_name = getattr(mod_conf, 'backend', 'xmlrpc')
+        self.json_uri = getattr(mod_conf, 'json_uri', '')
+        if not self.json_uri:
+            self.json_uri = self.uri.replace('xmlrpc.php', 'rest.php')
+
+        # Pool of kept alive connections used to request the web services
+        self.pool_size = int(getattr(mod_conf, 'pool_size', '4'))
+        self.connect_timeout = float(getattr(mod_conf, 'connect_timeout', '0')) or None
+        self.read_timeout = float(getattr(mod_conf, 'read_timeout', '0')) or None
+        logger.info("Connections pool size: %d, timeouts: %s (connect) / %s (read)",
+                    self.pool_size, self.connect_timeout, self.read_timeout)
+        # Compression of the responses and of the requests bigger than a threshold
+        self.gzip = (getattr(mod_conf, 'gzip', '1') == '1')
+        self.gzip_threshold = int(getattr(mod_conf, 'gzip_request_threshold', '0')) or None
+        logger.info("Compression, responses: %s, requests bigger than: %s bytes",
+                    self.gzip, self.gzip_threshold)
+        self.transferred = (0, 0, 0.0)
+
+        backend_parameters = {
+            'pool_size': self.pool_size,
+            'connect_timeout': self.connect_timeout,
+            'read_timeout': self.read_timeout,
+            'verbose': self.verbose,
+            'gzip': self.gzip,
+            'gzip_threshold': self.gzip_threshold
+        }
+        try:
+            self.backend = get_backend(self.backend_name, self.json_uri
+                                       if self.backend_name == 'json' else self.uri,
+                                       **backend_parameters)
+        except ValueError as exp:
+            logger.error("%s, using the xmlrpc backend", str(exp))
+            self.backend_name = 'xmlrpc'
+            self.backend = get_backend(self.backend_name, self.uri, **backend_parameters)
+        logger.info("configured backend: %s, uri: %s", self.backend_name, self.backend.uri)
+
+        # Retries of the requests failing on a transient error, with a jittered exponential
+        # backoff, and circuit breaker suspending the requests after consecutive failures
+        self.retry_policy = RetryPolicy(
+            int(getattr(mod_conf, 'retries', '2')),
+            float(getattr(mod_conf, 'retry_backoff', '0.5')),
+            float(getattr(mod_conf, 'retry_max_backoff', '10')))
+        self.breaker = None
+        circuit_threshold = int(getattr(mod_conf, 'circuit_threshold', '5'))
+        if circuit_threshold > 0:
+            self.breaker = CircuitBreaker(circuit_threshold,
+                                          float(getattr(mod_conf, 'circuit_reset', '30')),
+                                          on_open=self._circuit_opened)
+        logger.info("Retries: %d, backoff: %.1f seconds (max %.1f), circuit breaker: %s",
+                    self.retry_policy.retries, self.retry_policy.backoff,
+                    self.retry_policy.max_backoff,
+                    '%d failures, %d seconds' % (circuit_threshold, self.breaker.reset_timeout)
+                    if self.breaker else 'disabled')
+
+        # Import engine: worker threads or asyncio (Python 3.5+)
+        self.engine = getattr(mod_conf, 'engine', 'threads')
+        self.async_concurrency = max(1, int(getattr(mod_conf, 'async_concurrency', '16')))
+        self.async_http = getattr(mod_conf, 'async_http', 'auto')
+        if self.engine == 'asyncio':
+            try:
+                # Python 3.5+ only, the module is not imported on the other versions
+                from .async_engine import AsyncBackend  # pylint: disable=import-outside-toplevel
+                self.backend = AsyncBackend(self.backend.uri, self.backend_name,
+                                            self.async_concurrency, self.async_http,
+                                            **backend_parameters)
+                self.backend.retry_policy = self.retry_policy
+                self.backend.breaker = self.breaker
+                self.backend.on_unpaginated = self._unpaginated
+                logger.info("asyncio engine, %d concurrent requests, HTTP client: %s",
+                            self.async_concurrency, self.backend.client.name)
+            except (ImportError, SyntaxError, ValueError) as exp:
+                logger.error("The asyncio engine is not available (%s), "
+                             "using the threads engine", str(exp))
+                self.engine = 'threads'
+        elif self.engine != 'threads':
+            logger.error("Unknown engine '%s', using the threads engine", self.engine)
+            self.engine = 'threads'
+
+        # Group the web services requests in system.multicall requests
+        self.multicall = (getattr(mod_conf, 'multicall', '0') == '1')
+        self.multicall_size = max(1, int(getattr(mod_conf, 'multicall_size', '8')))
+        if self.multicall and self.backend_name != 'xmlrpc':
+            logger.warning("multicall is only available with the xmlrpc backend")
+            self.multicall = False
+        if self.multicall and self.engine == 'asyncio':
+            logger.warning("multicall is not available with the asyncio engine")
+            self.multicall = False
+        if self.multicall:
+            logger.info("multicall requests of %d web services", self.multicall_size)
 
     def init(self):
         """
@@ -175,49 +440,1095 @@ class GlpiConfiguration(BaseModule):
             # True because False will make the module get reloaded endlessly!
             return True
 
+        logger.info("Connecting to %s", self.backend.uri)
+        self.con = self.backend
+        logger.info("Connection opened")
+        self.session = self._stored_session()
+        if self.session:
+            logger.info("Reusing the stored session: %s", self.session)
+        else:
+            self._login()
+
+        return self.con is not None
+
+    def _login(self):
+        """Open a Glpi session
+
+        :return: True if the session is opened
+        """
         try:
-            logger.info("Connecting to %s", self.uri)
-            self.con = xc.ServerProxy(self.uri, encoding='utf-8', verbose=self.verbose)
-            logger.info("Connection opened")
             logger.info("Authentication in progress...")
-            res = self.con.glpi.doLogin({
-                'login_name': self.login_name,
-                'login_password': self.login_password})
+            start = time.time()
+            with measure(self._profile, 'network'):
+                res = self.con.call('glpi.doLogin', {
+                    'login_name': self.login_name,
+                    'login_password': self.login_password})
+            self.statsmgr.timer('glpi.login', time.time() - start)
             self.session = res['session']
             logger.info("Authenticated, session : %s", self.session)
         except Exception as e:
+            self.statsmgr.counter('glpi.login.errors', 1)
             logger.error("Glpi WS connection error: %s", str(e))
+            return False
 
-        return self.con is not None
+        self._store_session()
+        return True
+
+    def _relogin(self, expired):
+        """Open a new Glpi session when a request failed because its session expired
+
+        This function may be called concurrently by several worker threads, only the
+        first one opens a new session.
+
+        :param expired: session of the failed request
+        :return: True if a new session is opened
+        """
+        with self._session_lock:
+            if expired is None or self.session != expired:
+                # Another request already opened a new session or failed to
+                return self.session is not None
+            logger.warning("The Glpi session %s expired, opening a new session", expired)
+            self.statsmgr.counter('glpi.session.expired', 1)
+            if self.session_store:
+                self._clear_session()
+            if not self._login():
+                self.session = None
+            return self.session is not None
+
+    def _with_session(self, parameters):
+        """Get the parameters of a request with the current session
+
+        :param parameters: web service call parameters
+        :return: web service call parameters
+        """
+        if self.session is None or parameters.get('session') == self.session:
+            return parameters
+        parameters = dict(parameters)
+        parameters['session'] = self.session
+        return parameters
+
+    def _stored_session(self):
+        """Get the session stored by a previous module instance
+
+        The stored session is only checked locally (same uri and login, recently used):
+        if Glpi closed it, the first request fails and a new session is opened.
+
+        :return: the session token, None if no valid session is stored
+        """
+        if not self.session_store:
+            return None
+        try:
+            return self.session_store.load()
+        except (IOError, OSError, KeyError, TypeError, ValueError) as exp:
+            logger.warning("Invalid session file %s: %s", self.session_store.path, str(exp))
+        return None
+
+    def _store_session(self):
+        """Store the current session for the next module instance
+
+        :return: None
+        """
+        if not self.session_store or not self.session:
+            return
+        try:
+            self.session_store.save(self.session)
+        except (IOError, OSError) as exp:
+            logger.error("Could not store the session in %s: %s",
+                         self.session_store.path, str(exp))
+
+    def _clear_session(self):
+        """Remove the stored session
+
+        :return: None
+        """
+        try:
+            self.session_store.clear()
+        except (IOError, OSError) as exp:
+            logger.error("Could not remove the session file %s: %s",
+                         self.session_store.path, str(exp))
+
+    def main(self):
+        """Main function of the external module process
+
+        The configuration snapshot is refreshed until the module is stopped.
+        """
+        # The module process is forked from the arbiter, the connections opened by the
+        # arbiter are not shared with it
+        self.backend.close()
+        logger.info("Refreshing the configuration snapshot every %d seconds", self.refresh_period)
+        while not self.interrupted:
+            self.do_loop_turn()
+        logger.info("Stopped refreshing the configuration snapshot")
 
     def do_loop_turn(self):
         """This function is called/used when you need a module with
         a loop function (and use the parameter 'external': True)
+
+        In external mode, the configuration snapshot is refreshed every refresh_period
+        seconds. The turn ends when the next refresh is due or the module is stopped.
+        """
+        if not self.is_external:
+            time.sleep(1)
+            return
+        if time.time() - self._refreshed >= self.refresh_period:
+            self._refresh_snapshot()
+        # Wait for the next refresh, checking every second that the module is not stopped
+        next_refresh = self._refreshed + self.refresh_period
+        while not self.interrupted and time.time() < next_refresh:
+            time.sleep(max(0, min(1, next_refresh - time.time())))
+
+    def _refresh_snapshot(self):
+        """Import the configuration from Glpi to refresh the snapshot
+
+        If the import is not complete, the snapshot is not updated and the arbiter will
+        load the last complete configuration.
+
+        :return: None
+        """
+        self._refreshed = time.time()
+        if not self.session:
+            # Glpi was not available when the module was initialized
+            self.init()
+        if not self.session:
+            logger.warning("No opened session, the snapshot is not refreshed")
+            return
+
+        self._import_objects(self._load_snapshot())
+        logger.info("Refreshed the configuration snapshot in %.3f seconds",
+                    time.time() - self._refreshed)
+
+    def _get_entity_objects(self, parameters, entity):
+        """Get the configuration objects of one entity
+
+        This function may be called concurrently by several worker threads.
+
+        :param parameters: web services call parameters
+        :param entity: entity tag
+        :return: list of (ws, items) tuples in the self.ws order, items is None if
+        the web service request failed
+        """
+        entity = entity.strip()
+        if entity:
+            logger.info(" Getting configuration for entity tagged with '%s'", entity)
+        else:
+            logger.info(" Getting configuration for all entities")
+
+        parameters = dict(parameters)
+        parameters['entity'] = entity
+
+        wss = [ws for ws in self.ws if ws['method']]
+        if self.concurrent_calls and len(wss) > 1:
+            pool = ThreadPool(len(wss))
+            try:
+                fetched = pool.map(partial(self._get_ws_objects, parameters), wss)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            fetched = [self._get_ws_objects(parameters, ws) for ws in wss]
+
+        # Assemble in the declared web services order
+        return list(zip(wss, fetched))
+
+    def _ws_parameters(self, parameters, ws):
+        """Get the parameters of a web service call for an entity
+
+        :param parameters: web service call parameters
+        :param ws: web service description (an item of self.ws)
+        :return: web service call parameters
+        """
+        since = self._delta.get(parameters['entity'], {}).get(ws['type'])
+        if since:
+            # Only request the objects modified since the last import
+            parameters = dict(parameters)
+            parameters[ws['since']] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(since))
+        return parameters
+
+    @staticmethod
+    def _got_items(parameters, ws, items):
+        """Log the objects got for an entity
+
+        :return: list of items, as compact records
+        """
+        if ws['since'] in parameters:
+            logger.info("Got %s %ss modified since %s", len(items) if items else 'no',
+                        ws['type'], parameters[ws['since']])
+        else:
+            logger.info("Got %s %ss", len(items) if items else 'no', ws['type'])
+        return ws['records'].records(items or [])
+
+    def _get_ws_objects(self, parameters, ws):
+        """Get the objects of one type for an entity
+
+        This function may be called concurrently by several worker threads.
+
+        :param parameters: web service call parameters
+        :param ws: web service description (an item of self.ws)
+        :return: list of items, None if an error occurred
+        """
+        parameters = self._ws_parameters(parameters, ws)
+        metric = self._metric(parameters['entity'], ws['type'])
+        start = time.time()
+        try:
+            if ws['page_size']:
+                items = self._get_pages(ws, parameters)
+            else:
+                items = self._call_ws(ws, parameters)
+            self.statsmgr.timer(metric + '.time', time.time() - start)
+            self.statsmgr.counter(metric + '.items', len(items or []))
+            return self._got_items(parameters, ws, items)
+        except Exception as exp:
+            self._ws_error(parameters, ws, exp)
+            if not isinstance(exp, (xc.Fault, xc.ProtocolError, socket.timeout,
+                                    CircuitOpenError)):
+                logger.error(traceback.print_exc())
+
+        self.statsmgr.counter(metric + '.errors', 1)
+        return None
+
+    def _ws_error(self, parameters, ws, exp):
+        """Log a web service request error, the timed out requests are reported
+
+        :param parameters: web service call parameters
+        :param ws: web service description (an item of self.ws)
+        :param exp: raised exception
+        :return: None
+        """
+        if isinstance(exp, socket.timeout):
+            logger.error("Timeout when getting the %ss of tag '%s': %s",
+                         ws['type'], parameters['entity'], str(exp))
+            self.timeouts.append((parameters['entity'], ws['type']))
+        elif isinstance(exp, CircuitOpenError):
+            logger.error("The %ss of tag '%s' are not requested: %s",
+                         ws['type'], parameters['entity'], str(exp))
+        elif isinstance(exp, xc.Fault):
+            logger.error("XML RPC fault: %s / %s",
+                         exp.faultCode, exp.faultString)
+        elif isinstance(exp, xc.ProtocolError):
+            logger.error("XML RPC protocol error: %s / %s, url: %s",
+                         exp.errcode, exp.errmsg, exp.url)
+        else:
+            logger.error("Exception when getting tag '%s': %s / %s", parameters['entity'],
+                         type(exp), str(exp))
+
+    def _call_ws(self, ws, parameters):
+        """Request a web service and count the received bytes and the retried requests
+
+        :param ws: web service description (an item of self.ws)
+        :param parameters: web service call parameters
+        :return: web service response
+        """
+        metric = self._metric(parameters['entity'], ws['type'])
+        self.backend.stats.take()
+        try:
+            return self._request(
+                lambda timeout: self.backend.call(ws['method'], self._with_session(parameters),
+                                                  timeout=timeout),
+                [ws], "%ss of tag '%s'" % (ws['type'], parameters['entity']))
+        finally:
+            received, retries = self.backend.stats.take()
+            self.statsmgr.counter(metric + '.bytes', received)
+            if retries:
+                self.statsmgr.counter(metric + '.retries', retries)
+
+    def _request(self, request, wss, description):
+        """Send a Glpi request and retry it on transient errors
+
+        The request is not sent if the circuit breaker is open. If the session expired,
+        a new session is opened and the request is sent again with the new session (the
+        request must get its parameters from _with_session). Raise the error of the last
+        attempt if the request failed.
+
+        :param request: callable sending the request, called with the request timeout
+        :param wss: requested web services
+        :param description: request description for the logs
+        :return: request response
+        """
+        attempt = 0
+        relogged = False
+        while True:
+            timeout = self._call_timeout(*wss)
+            if self.breaker is not None:
+                self.breaker.before()
+            session = self.session
+            try:
+                with measure(self._profile, 'network'):
+                    response = request(timeout)
+            except Exception as exp:  # pylint: disable=broad-except
+                if self.breaker is not None:
+                    self.breaker.record(exp)
+                    if self.breaker.state == CircuitBreaker.OPEN:
+                        raise
+                if not relogged and is_session_expired(exp, self.session_expired):
+                    relogged = True
+                    if self._relogin(session):
+                        continue
+                    raise
+                delay = self.retry_policy.retry_delay(exp, attempt, self._deadline)
+                if delay is None:
+                    raise
+                logger.warning("Request of the %s failed: %s, retrying in %.3f seconds",
+                               description, str(exp), delay)
+                self.backend.stats.retry()
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            if self.breaker is not None:
+                self.breaker.record()
+            return response
+
+    def _circuit_opened(self, failures):
+        """The circuit breaker opened, the Glpi requests are suspended"""
+        self.statsmgr.counter('glpi.circuit.open', 1)
+        logger.error("%d consecutive Glpi requests failed, the requests are suspended "
+                     "for %d seconds", failures, self.breaker.reset_timeout)
+
+    def _call_timeout(self, *wss):
+        """Get the read timeout of a request, bounded by the import deadline
+
+        Raise socket.timeout if the import deadline is reached.
+
+        :param wss: requested web services, the longest timeout applies
+        :return: timeout in seconds, None to not bound the request
+        """
+        timeouts = [ws['timeout'] or self.read_timeout for ws in wss]
+        timeout = max(timeouts) if timeouts and None not in timeouts else None
+        if self._deadline:
+            remaining = self._deadline - time.time()
+            if remaining <= 0:
+                raise socket.timeout("Import deadline reached")
+            timeout = min(timeout or remaining, remaining)
+        return timeout
+
+    @staticmethod
+    def _metric(entity, object_type):
+        """Get the metrics name of the objects of an entity
+
+        :param entity: entity tag, empty for all the entities
+        :param object_type: objects type
+        :return: glpi.<entity>.<object type>
+        """
+        return 'glpi.%s.%s' % (re.sub(r'[^\w-]', '_', entity) or 'all', object_type)
+
+    def _multicall_objects(self, parameters, workers):
+        """Get the configuration objects of all the entities with system.multicall requests
+
+        The web services requests of all the entities are grouped in batches of
+        multicall_size requests. Paginated web services are requested on their own.
+
+        :param parameters: web services call parameters
+        :param workers: number of batches requested concurrently
+        :return: list of objects per entity, as returned by _get_entity_objects
+        """
+        entities, calls = self._entity_calls(parameters)
+        batches = self._multicall_batches(calls)
+        logger.info("Getting configuration for %d entities with %d requests",
+                    len(entities), len(batches))
+
+        items = {}
+        for batch, batch_items in zip(batches, self._request_batches(batches, workers)):
+            for (idx, ws, _), call_items in zip(batch, batch_items):
+                items[(idx, ws['type'])] = call_items
+
+        return self._assemble(entities, items)
+
+    def _multicall_batches(self, calls):
+        """Group the web services requests in batches of multicall_size requests
+
+        :param calls: list of (entity index, ws, parameters) tuples
+        :return: list of batches, each one a list of calls
+        """
+        grouped = [call for call in calls if not call[1]['page_size']]
+        batches = [grouped[start:start + self.multicall_size]
+                   for start in range(0, len(grouped), self.multicall_size)]
+        # Paginated web services are requested on their own
+        batches.extend([call] for call in calls if call[1]['page_size'])
+        return batches
+
+    def _request_batches(self, batches, workers):
+        """Request the batches, concurrently if several workers are configured
+
+        :param batches: list of batches, as returned by _multicall_batches
+        :param workers: number of batches requested concurrently
+        :return: list of the items of the batches calls, as returned by _multicall_batch
+        """
+        if workers <= 1:
+            return [self._multicall_batch(batch) for batch in batches]
+        pool = ThreadPool(workers)
+        try:
+            return pool.map(self._multicall_batch, batches)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _entity_calls(self, parameters):
+        """Get the web services requests of all the entities
+
+        :param parameters: web services call parameters
+        :return: (entities, calls), calls is a list of (entity index, ws, parameters) tuples
+        """
+        entities = [entity.strip() for entity in self.entities]
+        calls = []
+        for idx, entity in enumerate(entities):
+            entity_parameters = dict(parameters)
+            entity_parameters['entity'] = entity
+            for ws in self.ws:
+                if ws['method']:
+                    calls.append((idx, ws, self._ws_parameters(entity_parameters, ws)))
+        return entities, calls
+
+    def _assemble(self, entities, items):
+        """Assemble the objects of the entities in the declared web services order
+
+        :param entities: entities tags
+        :param items: {(entity index, object type): items}
+        :return: list of objects per entity, as returned by _get_entity_objects
+        """
+        return [[(ws, items[(idx, ws['type'])]) for ws in self.ws if ws['method']]
+                for idx in range(len(entities))]
+
+    def _async_objects(self, parameters):
+        """Get the configuration objects of all the entities with the asyncio engine
+
+        The web services requests of all the entities are in flight at the same time,
+        at most async_concurrency requests to the Glpi endpoint.
+
+        :param parameters: web services call parameters
+        :return: list of objects per entity, as returned by _get_entity_objects
+        """
+        entities, calls = self._entity_calls(parameters)
+        logger.info("Getting configuration for %d entities with %d concurrent requests",
+                    len(entities), min(len(calls), self.async_concurrency))
+        try:
+            session = self.session
+            results = self._async_fetch(calls)
+
+            # The requests failed because the session expired are sent again with a new
+            # session
+            expired = [index for index, result in enumerate(results)
+                       if is_session_expired(result[0], self.session_expired)]
+            if expired and self._relogin(session):
+                for index, result in zip(expired, self._async_fetch([calls[index]
+                                                                     for index in expired])):
+                    results[index] = result
+        finally:
+            # The connections and the event loop are not kept until the next import
+            self.backend.close()
+
+        items = {}
+        for (idx, ws, ws_parameters), result in zip(calls, results):
+            items[(idx, ws['type'])] = self._async_items(ws, ws_parameters, result)
+        return self._assemble(entities, items)
+
+    def _async_items(self, ws, parameters, result):
+        """Get the objects of a web service requested with the asyncio engine
+
+        :param ws: web service
+        :param parameters: web service parameters
+        :param result: (response or exception, duration, received, retries) tuple
+        :return: list of objects, None if the request failed
+        """
+        response, duration, received, retries = result
+        metric = self._metric(parameters['entity'], ws['type'])
+        self.statsmgr.counter(metric + '.bytes', received)
+        if retries:
+            self.statsmgr.counter(metric + '.retries', retries)
+        if isinstance(response, Exception):
+            self._ws_error(parameters, ws, response)
+            self.statsmgr.counter(metric + '.errors', 1)
+            return None
+        self.statsmgr.timer(metric + '.time', duration)
+        self.statsmgr.counter(metric + '.items', len(response or []))
+        return self._got_items(parameters, ws, response)
+
+    def _async_fetch(self, calls):
+        """Request web services with the asyncio engine, until the import deadline
+
+        :param calls: list of (entity index, ws, parameters) tuples
+        :return: list of (response or exception, duration, received, retries) tuples
+        """
+        timeout = None
+        if self._deadline:
+            timeout = max(0, self._deadline - time.time())
+        with measure(self._profile, 'network'):
+            return self.backend.fetch([(ws['method'], self._with_session(ws_parameters),
+                                        ws['page_size'], ws['timeout'])
+                                       for _, ws, ws_parameters in calls], timeout)
+
+    def _multicall_batch(self, batch):
+        """Request a batch of web services in one system.multicall request
+
+        If the server does not support system.multicall, multicall is disabled and the
+        web services are requested one by one.
+
+        :param batch: list of (entity index, ws, parameters) tuples
+        :return: list of items lists, None for the failed requests
+        """
+        if self.multicall and len(batch) > 1:
+            start = time.time()
+            self.backend.stats.take()
+            try:
+                responses = self._request(
+                    lambda timeout: self.backend.multicall(
+                        [(ws['method'], self._with_session(parameters))
+                         for _, ws, parameters in batch], timeout),
+                    [ws for _, ws, _ in batch], 'multicall')
+                self.statsmgr.timer('glpi.multicall.time', time.time() - start)
+            except (socket.timeout, CircuitOpenError) as exp:
+                self.statsmgr.counter('glpi.multicall.errors', 1)
+                for _, ws, parameters in batch:
+                    self._ws_error(parameters, ws, exp)
+                return [None] * len(batch)
+            except xc.Fault as exp:
+                logger.warning("system.multicall is not available (%s / %s), "
+                               "requesting the web services one by one",
+                               exp.faultCode, exp.faultString)
+                self.multicall = False
+            except Exception as exp:
+                self.statsmgr.counter('glpi.multicall.errors', 1)
+                logger.error("Exception when requesting a multicall: %s / %s, "
+                             "requesting the web services one by one", type(exp), str(exp))
+            else:
+                batch_items = []
+                for (_, ws, parameters), response in zip(batch, responses):
+                    metric = self._metric(parameters['entity'], ws['type'])
+                    if is_session_expired(response, self.session_expired):
+                        # Requested again on its own, with a new session
+                        batch_items.append(self._get_ws_objects(parameters, ws))
+                    elif isinstance(response, xc.Fault):
+                        logger.error("XML RPC fault: %s / %s",
+                                     response.faultCode, response.faultString)
+                        self.statsmgr.counter(metric + '.errors', 1)
+                        batch_items.append(None)
+                    else:
+                        self.statsmgr.counter(metric + '.items', len(response or []))
+                        batch_items.append(self._got_items(parameters, ws, response))
+                return batch_items
+            finally:
+                received, retries = self.backend.stats.take()
+                self.statsmgr.counter('glpi.multicall.bytes', received)
+                if retries:
+                    self.statsmgr.counter('glpi.multicall.retries', retries)
+
+        return [self._get_ws_objects(parameters, ws) for _, ws, parameters in batch]
+
+    def _get_page(self, ws, parameters, start, stopped=None):
+        """Request one page of a Glpi WS
+
+        :param ws: web service description (an item of self.ws)
+        :param parameters: web service call parameters
+        :param start: index of the first requested object
+        :param stopped: threading.Event set when the last page was received, the page is
+        then not requested
+        :return: list of items
+        """
+        if stopped is not None and stopped.is_set():
+            return []
+        parameters = dict(parameters)
+        parameters['start'] = start
+        parameters['limit'] = ws['page_size']
+        return self._call_ws(ws, parameters) or []
+
+    def _get_pages(self, ws, parameters):
+        """Request a Glpi WS page after page until a page is not full
+
+        Several pages are requested concurrently: while a page is received, the next
+        ones are already requested. The pages are concatenated in order. The requests
+        stop if Glpi does not paginate the web service, see add_page.
+
+        :param ws: web service description (an item of self.ws)
+        :param parameters: web service call parameters
+        :return: list of items
         """
-        logger.info("In loop")
-        time.sleep(1)
+        items = []
+        previous = None
+        if self.page_prefetch == 1:
+            while True:
+                page = self._get_page(ws, parameters, len(items))
+                status = add_page(items, page, previous, ws['page_size'])
+                if status != 'next':
+                    return self._last_page(ws, items, status)
+                previous = page
+
+        pool = ThreadPool(self.page_prefetch)
+        stopped = threading.Event()
+        try:
+            pending = deque()
+            start = 0
+            while True:
+                # No more pages are requested once a page that is not full was received
+                while len(pending) < self.page_prefetch and not any(
+                        result.ready() and result.successful() and
+                        len(result.get()) != ws['page_size'] for result in pending):
+                    pending.append(pool.apply_async(self._get_page,
+                                                    (ws, parameters, start, stopped)))
+                    start += ws['page_size']
+                page = pending.popleft().get()
+                status = add_page(items, page, previous, ws['page_size'])
+                if status != 'next':
+                    return self._last_page(ws, items, status)
+                previous = page
+        finally:
+            # The pages requested after the last one are not requested if they are not
+            # sent yet, do not wait for the ones in progress
+            stopped.set()
+            pool.close()
+
+    def _last_page(self, ws, items, status):
+        """Log the end of a paginated request
+
+        :param ws: web service description (an item of self.ws)
+        :param items: items of all the pages
+        :param status: status of the last page, see add_page
+        :return: items
+        """
+        if status == 'unpaginated':
+            self._unpaginated(ws['method'], len(items), ws['page_size'])
+        else:
+            logger.debug("Got %d pages of %ss", len(items) // ws['page_size'] + 1, ws['type'])
+        return items
+
+    def _unpaginated(self, method, count, page_size):
+        """Glpi ignored the start and limit parameters of a paginated web service"""
+        logger.warning("Glpi does not paginate %s, got %d objects for a page of %d objects. "
+                       "The objects of the first page are kept, set the page size to 0 for "
+                       "this web service.", method, count, page_size)
+
+    def _merge_objects(self, result, objects, index):
+        """Merge the objects got for an entity into the result
+
+        Objects are identified by their name (see _natural_key). When an object with the
+        same name as an already merged one is found, the configured duplicates policy
+        applies: keep the first object, replace with the last one or merge their properties.
+
+        :param result: objects per type, as returned by get_objects
+        :param objects: list of (ws, items) tuples as returned by _get_entity_objects
+        :param index: position in the result of the merged objects, per type and name
+        :return: None
+        """
+        # Guard the logs that format each object
+        debug = logger.isEnabledFor(logging.DEBUG)
+        info = logger.isEnabledFor(logging.INFO)
+        for ws, items in objects:
+            type_list = ws.get('type_list', '%ss' % ws['type'])
+            type_index = index.setdefault(type_list, {})
+            added = duplicates = 0
+            for item in items or []:
+                if debug:
+                    logger.debug("-: %s", item)
+
+                key = self._natural_key(ws, item)
+                if key is None:
+                    # No name, identify the object with all its properties
+                    key = repr(sorted(item.items()))
+
+                if key in type_index:
+                    if self._merge_duplicate(result[type_list], type_index[key], ws, key, item):
+                        duplicates += 1
+                    continue
+
+                if info and (self.log_items == 'all' or added < self.log_sample):
+                    self._log_item(ws, key, item)
+                type_index[key] = len(result[type_list])
+                result[type_list].append(item)
+                added += 1
+                if debug:
+                    logger.debug("- %s: %s", ws['type'], item)
+
+            if info and self.log_items != 'all' and (added or duplicates):
+                logger.info("- %d %ss, %d duplicates (%s kept)",
+                            added, ws['type'], duplicates, self.duplicates)
+
+    def _merge_duplicate(self, type_objects, position, ws, key, item):
+        """Apply the duplicates policy to an object with the same name as a merged one
+
+        :param type_objects: merged objects of the type
+        :param position: position of the already merged object
+        :param ws: web service of the object
+        :param key: object name, as returned by _natural_key
+        :param item: duplicate object
+        :return: True if the objects differ, False if the object was already merged
+        """
+        if type_objects[position] == item:
+            return False
+        if self.log_items == 'all':
+            logger.info("- duplicate %s: %s, keeping the %s one",
+                        ws['type'], key, self.duplicates)
+        if self.duplicates == 'last':
+            type_objects[position] = item
+        elif self.duplicates == 'merge':
+            merged = dict(type_objects[position])
+            merged.update(item)
+            type_objects[position] = merged
+        return True
+
+    @staticmethod
+    def _log_item(ws, key, item):
+        """Log a merged object
+
+        :param ws: web service of the object
+        :param key: object name, as returned by _natural_key
+        :param item: merged object
+        :return: None
+        """
+        if 'register' in item:
+            # Item is a template
+            logger.info("- %s template: %s", ws['type'], item['name'])
+        elif isinstance(key, tuple):
+            logger.info("- %s: %s/%s", ws['type'], key[0], key[1])
+        else:
+            logger.info("- %s: %s", ws['type'], key)
 
     def get_objects(self):
         """
         Get configuration objects from GLPI assuming the session was opened
         on module initialization.
 
+        If a snapshot directory is configured, the objects are provided from the last
+        imported configuration snapshot while it is younger than the configured ttl.
+
+        When Glpi is not available, the objects that could not be imported are provided from
+        the last snapshot, whatever its age. If the import lasts more than the configured
+        deadline, the last snapshot is provided and the import goes on in the background
+        to update the snapshot for the next configuration load.
+
+        In external mode, the objects are provided from the snapshot refreshed by the
+        module process. Glpi is only requested if no snapshot is available yet.
+
+        The changed attribute tells if the provided objects changed since the last import
+        and the changes attribute summarizes the changes per object type.
+
+        When profiling, the import duration is broken down into categories (network,
+        unmarshalling, deduplication, logging, ...) and a report is written at the end of
+        the import.
+
         :return:
         """
-        result = {
-            'commands': [],
-            'realms': [],
-            'hosts': [],
-            'hostgroups': [],
-            'servicestemplates': [],
-            'services': [],
-            'contacts': [],
-            'timeperiods': []
-        }
+        if not self.profiling:
+            return self._get_objects()
+
+        profile = self._profile = self.backend.profile = ImportProfile()
+        handle = logger.handle
+
+        def profiled_handle(record):
+            """Measure the logs formatting and writing"""
+            with profile.measure('logging'):
+                handle(record)
+        logger.handle = profiled_handle
 
+        try:
+            with profile.measure('other'):
+                return self._get_objects()
+        finally:
+            del logger.handle
+            profile.stop()
+            self._profile = self.backend.profile = None
+            self._write_profile(profile)
+
+    def _get_objects(self):
+        """Get the configuration objects, see get_objects
+
+        :return: objects per type
+        """
+        snapshot = None
+        if self.snapshot:
+            snapshot = self._load_snapshot()
+            if snapshot:
+                self.statsmgr.gauge('glpi.snapshot.age', GlpiSnapshot.age(snapshot))
+
+        if self.is_external:
+            if snapshot:
+                if GlpiSnapshot.age(snapshot) > 2 * self.refresh_period:
+                    logger.warning("The configuration snapshot is %d seconds old, is the "
+                                   "module process refreshing it?", GlpiSnapshot.age(snapshot))
+                return self._snapshot_result(snapshot)
+            logger.warning("No configuration snapshot prepared by the module process, "
+                           "importing from Glpi")
+            if not self.session:
+                # The arbiter gets its configuration before it starts (and initializes)
+                # the external modules
+                self.init()
+
+        if snapshot and GlpiSnapshot.age(snapshot) < self.cache_ttl:
+            logger.info("Using the configuration imported %d seconds ago",
+                        GlpiSnapshot.age(snapshot))
+            return self._snapshot_result(snapshot)
+
+        if self._background is not None and not self._background.ready():
+            # The imports share the module state, only one import runs at a time
+            if snapshot:
+                logger.warning("The Glpi import started after the fetch deadline is still "
+                               "running, using the configuration imported %d seconds ago",
+                               GlpiSnapshot.age(snapshot))
+                return self._snapshot_result(snapshot)
+            logger.warning("Waiting for the end of the Glpi import started after the fetch "
+                           "deadline")
+            self._background.wait()
+        self._background = None
+
+        if not snapshot or not self.fetch_deadline:
+            return self._import_result(self._import_objects(snapshot), snapshot)
+
+        pool = ThreadPool(1)
+        try:
+            self._background = pool.apply_async(self._import_objects, (snapshot, ))
+            imported = self._background.get(self.fetch_deadline)
+        except PoolTimeoutError:
+            logger.warning("Glpi import did not complete in %d seconds, using the "
+                           "configuration imported %d seconds ago. The import goes on "
+                           "in the background to update the snapshot.",
+                           self.fetch_deadline, GlpiSnapshot.age(snapshot))
+            return self._snapshot_result(snapshot)
+        finally:
+            # Do not join, the pool thread ends when the import is complete
+            pool.close()
+
+        return self._import_result(imported, snapshot)
+
+    def _snapshot_result(self, snapshot):
+        """Build the objects list provided to the arbiter from a snapshot
+
+        :param snapshot: a loaded snapshot
+        :return: objects per type
+        """
+        return self._get_result(self._snapshot_objects(snapshot), snapshot.get('hashes'))
+
+    def _import_result(self, imported, snapshot):
+        """Build the objects list provided to the arbiter from an import
+
+        The snapshot is the previous import if no configuration was provided yet. The
+        objects that could not be imported are provided from the snapshot.
+
+        :param imported: (fetched, hashes) as returned by _import_objects
+        :param snapshot: last configuration snapshot, may be None
+        :return: objects per type
+        """
+        fetched, hashes = imported
+        if snapshot and self.content_hashes is None:
+            # Detect the changes since the snapshot import, with the stored hashes
+            self.content_hashes = snapshot.get('hashes')
+        if snapshot and self.diff_report and self.last_objects is None:
+            with measure(self._profile, 'assembly'):
+                self.last_objects = self._merge_result(self._snapshot_objects(snapshot))
+
+        result = self._fallback(fetched, snapshot)
+        return self._get_result(result, hashes if result is fetched else None)
+
+    def _import_objects(self, snapshot=None):
+        """Get the configuration objects from Glpi and save a snapshot if the import is complete
+
+        For an incremental import, only the objects modified since the snapshot are
+        requested and they are patched into the snapshot objects.
+
+        :param snapshot: last configuration snapshot, may be None
+        :return: (fetched, hashes), fetched is a list of (entity, objects) tuples as returned
+        by _fetch_objects and hashes the objects hashes stored in the snapshot, None if
+        they were not computed
+        """
+        start = time.time()
+        self._deadline = start + self.import_deadline if self.import_deadline else None
+        self._delta = self._get_delta(snapshot)
+        with measure(self._profile, 'fetch'):
+            fetched = self._fetch_objects()
+        if self._delta:
+            fetched = self._apply_delta(fetched, snapshot, self._delta)
+
+        hashes = None
+        if self.snapshot and fetched:
+            failed = [(entity, ws['type']) for entity, objects in fetched
+                      for ws, items in objects if items is None]
+            if failed:
+                logger.warning("Incomplete import, the snapshot is not updated. "
+                               "Failed requests: %s", failed)
+            else:
+                full_timestamp = None
+                if self._delta:
+                    full_timestamp = snapshot.get('full_timestamp', snapshot['timestamp'])
+                if self.change_detection:
+                    with measure(self._profile, 'assembly'):
+                        hashes = content_hashes(fetched, self.volatile_fields)
+                self._save_snapshot(fetched, start, full_timestamp, hashes)
+
+        return fetched, hashes
+
+    def _get_delta(self, snapshot):
+        """Get the objects types that may be imported incrementally
+
+        :param snapshot: last configuration snapshot, may be None
+        :return: {entity: {object type: last import time}}
+        """
+        if not self.incremental or not snapshot:
+            return {}
+
+        full_age = time.time() - snapshot.get('full_timestamp', snapshot['timestamp'])
+        if full_age > self.incremental_full_period:
+            logger.info("Last full import is %d seconds old, full import", full_age)
+            return {}
+
+        delta = {}
+        for item in snapshot['entities']:
+            updated = item.get('updated', {})
+            delta[item['entity']] = dict((ws['type'], updated[ws['type']])
+                                         for ws in self.ws
+                                         if ws['since'] and ws['type'] in updated)
+        return delta
+
+    def _apply_delta(self, fetched, snapshot, delta):
+        """Patch the snapshot objects with the objects modified since the last import
+
+        A modified object replaces the snapshot object with the same name, a new object is
+        appended. Deleted objects are only removed by the next full import.
+
+        :param fetched: list of (entity, objects) tuples as returned by _fetch_objects
+        :param snapshot: last configuration snapshot
+        :param delta: incremental objects types as returned by _get_delta
+        :return: list of (entity, objects) tuples
+        """
+        cached = dict((item['entity'], item['objects']) for item in snapshot['entities'])
+        patched = []
+        for entity, objects in fetched:
+            patched_objects = []
+            for ws, items in objects:
+                if items is not None and ws['type'] in delta.get(entity, {}):
+                    modified = items
+                    items = list(cached[entity].get(ws['type'], []))
+                    index = dict((self._natural_key(ws, item), idx)
+                                 for idx, item in enumerate(items))
+                    for item in modified:
+                        key = self._natural_key(ws, item)
+                        if key in index:
+                            items[index[key]] = item
+                        else:
+                            index[key] = len(items)
+                            items.append(item)
+                    logger.info("Patched %d %ss of the entity '%s'",
+                                len(modified), ws['type'], entity)
+                patched_objects.append((ws, items))
+            patched.append((entity, patched_objects))
+        return patched
+
+    @staticmethod
+    def _natural_key(ws, item):
+        """Get the name that identifies an object
+
+        :param ws: web service description (an item of self.ws)
+        :param item: object
+        :return: ('template', name) for a template, host/service names for a service, else
+        object name. None if the object is not named: a service without host_name (defined
+        for a hostgroup) is only identified by all its properties
+        """
+        if 'register' in item:
+            # Item is a template, its name may be the name of an object of the same type
+            name = item.get('name')
+            return None if name is None else ('template', name)
+        type_name = ws.get('type_name', '%s_name' % ws['type'])
+        if type_name == 'service_description':
+            if item.get('host_name') is None or item.get(type_name) is None:
+                return None
+            return (item['host_name'], item[type_name])
+        return item.get(type_name)
+
+    def _fallback(self, fetched, snapshot):
+        """Replace the objects that could not be imported with the snapshot ones
+
+        :param fetched: list of (entity, objects) tuples as returned by _fetch_objects
+        :param snapshot: last configuration snapshot, may be None
+        :return: list of (entity, objects) tuples
+        """
+        if not snapshot:
+            return fetched
+
+        if not fetched:
+            logger.warning("Nothing imported from Glpi, using the configuration imported "
+                           "%d seconds ago", GlpiSnapshot.age(snapshot))
+            return self._snapshot_objects(snapshot)
+
+        cached = dict((item['entity'], item['objects']) for item in snapshot['entities'])
+        patched = []
+        replaced = False
+        for entity, objects in fetched:
+            patched_objects = []
+            for ws, items in objects:
+                if items is None and ws['type'] in cached.get(entity, {}):
+                    logger.warning("Using the %ss of the entity '%s' imported %d seconds ago",
+                                   ws['type'], entity, GlpiSnapshot.age(snapshot))
+                    items = cached[entity][ws['type']]
+                    replaced = True
+                patched_objects.append((ws, items))
+            patched.append((entity, patched_objects))
+        return patched if replaced else fetched
+
+    def _load_snapshot(self):
+        """Load the configuration snapshot
+
+        :return: the snapshot, None if no valid snapshot is available
+        """
+        try:
+            with measure(self._profile, 'snapshot'):
+                snapshot = self.snapshot.load()
+        except (IOError, OSError, ValueError) as exp:
+            logger.warning("Invalid snapshot %s: %s", self.snapshot.path, str(exp))
+            return None
+
+        if snapshot is None:
+            logger.info("No configuration snapshot available")
+            return None
+
+        # Configured entities must all be available in the snapshot
+        configured = [entity.strip() for entity in self.entities]
+        available = [item['entity'] for item in snapshot['entities']]
+        if configured and configured != available:
+            logger.info("The configuration snapshot does not match the configured entities")
+            return None
+
+        return snapshot
+
+    def _save_snapshot(self, fetched, timestamp, full_timestamp=None, hashes=None):
+        """Save a configuration snapshot
+
+        :param fetched: list of (entity, objects) tuples as returned by _fetch_objects
+        :param timestamp: import start time
+        :param full_timestamp: last full import time, None for a full import
+        :param hashes: objects hashes, as returned by content_hashes
+        :return: None
+        """
+        entities = [(entity, dict((ws['type'], items) for ws, items in objects),
+                     dict((ws['type'], timestamp) for ws, _ in objects))
+                    for entity, objects in fetched]
+        try:
+            with measure(self._profile, 'snapshot'):
+                self.snapshot.save(entities, timestamp, full_timestamp, hashes)
+            logger.info("Saved the configuration snapshot: %s", self.snapshot.path)
+        except (IOError, OSError, TypeError, ValueError) as exp:
+            logger.error("Could not save the snapshot %s: %s", self.snapshot.path, str(exp))
+
+    def _snapshot_objects(self, snapshot):
+        """Get the objects stored in a snapshot
+
+        :param snapshot: a loaded snapshot
+        :return: list of (entity, objects) tuples as returned by _fetch_objects
+        """
+        fetched = []
+        for item in snapshot['entities']:
+            objects = [(ws, item['objects'][ws['type']])
+                       for ws in self.ws if ws['type'] in item['objects']]
+            fetched.append((item['entity'], objects))
+        return fetched
+
+    def _fetch_objects(self):
+        """Get the configuration objects of all the entities from Glpi
+
+        :return: list of (entity, objects) tuples, objects is a list of (ws, items)
+        tuples as returned by _get_entity_objects
+        """
+        start = time.time()
         if not self.session:
             logger.error("No opened session, I cannot provide any objects to the arbiter.")
-            return result
+            return []
+        # Only count the data transferred for this import
+        self.backend.stats.reset()
+        self.timeouts = []
 
         # Set entity as empty to get all possible entities from Glpi
         parameters = {
@@ -235,7 +1546,14 @@ class GlpiConfiguration(BaseModule):
         if not self.entities:
             try:
                 # Get items, request the configured WS
-                items = self.con.monitoring.getMonitoredEntities(parameters)
+                self.backend.stats.take()
+                items = self._request(
+                    lambda timeout: self.con.call('monitoring.getMonitoredEntities',
+                                                  self._with_session(parameters),
+                                                  timeout=timeout),
+                    [], 'entities list')
+                self.statsmgr.timer('glpi.entities', time.time() - start)
+                self.statsmgr.counter('glpi.entities.bytes', self.backend.stats.take()[0])
                 logger.info("Got %d entities", len(items) if items else 'no')
                 for item in items:
                     logger.debug("-: %s", item)
@@ -251,85 +1569,225 @@ class GlpiConfiguration(BaseModule):
                              exp.errcode, exp.errmsg, exp.url)
             except Exception as exp:
                 logger.error("Exception when getting entities list: %s / %s", type(exp), str(exp))
+            if not self.entities:
+                self.statsmgr.counter('glpi.entities.errors', 1)
 
         if not self.entities:
             logger.warning("No entities are available to get monitoring configuration.")
-            return result
+            return []
 
-        # pylint: disable=too-many-nested-blocks
-        for entity in self.entities:
-            entity = entity.strip()
-            if entity:
-                logger.info(" Getting configuration for entity tagged with '%s'", entity)
-            else:
-                logger.info(" Getting configuration for all entities")
+        # Get the configuration of each entity, concurrently if several workers are configured
+        workers = min(self.max_workers, len(self.entities))
+        if self.engine == 'asyncio':
+            fetched = self._async_objects(parameters)
+        elif self.multicall:
+            fetched = self._multicall_objects(parameters, workers)
+        elif workers > 1:
+            logger.info("Getting configuration for %d entities with %d workers",
+                        len(self.entities), workers)
+            pool = ThreadPool(workers)
+            try:
+                # map returns the results in the entities order
+                fetched = pool.map(partial(self._get_entity_objects, parameters), self.entities)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            fetched = [self._get_entity_objects(parameters, entity) for entity in self.entities]
 
-            parameters['entity'] = entity
+        if self.timeouts:
+            self.statsmgr.counter('glpi.timeouts', len(self.timeouts))
+            logger.warning("Timed out requests, %s", self._timeouts_report())
+        # The session was just used, it remains valid for the next module instance
+        self._store_session()
 
-            for ws in self.ws:
-                if not ws['method']:
-                    continue
+        # Data transferred for this import: received bytes, decoded bytes, decompression time
+        self.transferred = self.backend.stats.reset()
+        self.statsmgr.timer('glpi.import', time.time() - start)
+        self.statsmgr.gauge('glpi.entities.count', len(self.entities))
+        self.statsmgr.gauge('glpi.received', self.transferred[0])
+        self.statsmgr.gauge('glpi.decoded', self.transferred[1])
+        logger.info("Imported in %.3f seconds with the %s backend", time.time() - start,
+                    self.backend_name)
+        logger.info("Received %d bytes, %d bytes decoded, decompression time: %.3f seconds",
+                    *self.transferred)
 
-                try:
-                    if sys.version_info[0] < 3:
-                        if ws['type'] == 'command':
-                            items = self.con.monitoring.getConfigCommands(parameters)
-                        if ws['type'] == 'host':
-                            items = self.con.monitoring.getConfigHosts(parameters)
-                        if ws['type'] == 'hostgroup':
-                            items = self.con.monitoring.getConfigHostgroups(parameters)
-                        if ws['type'] == 'servicestemplate':
-                            items = self.con.monitoring.getConfigServicesTemplates(parameters)
-                        if ws['type'] == 'service':
-                            items = self.con.monitoring.getConfigServices(parameters)
-                        if ws['type'] == 'contact':
-                            items = self.con.monitoring.getConfigContacts(parameters)
-                        if ws['type'] == 'realm':
-                            items = self.con.monitoring.getConfigRealms(parameters)
-                        if ws['type'] == 'timeperiod':
-                            items = self.con.monitoring.getConfigTimeperiods(parameters)
-                    else:
-                        # Get items, request the configured WS
-                        fct = getattr(self.con, ws['method'], None)
-                        if fct:
-                            items = fct(parameters)
-
-                    logger.info("Got %s %ss", len(items) if items else 'no', ws['type'])
-                    for item in items:
-                        logger.debug("-: %s", item)
-
-                        if item not in result['%ss' % ws['type']]:
-                            if 'register' in item:
-                                # Item is a template
-                                logger.info("- %s template: %s", ws['type'], item['name'])
-                            else:
-                                type_name = ws.get('type_name', '%s_name' % ws['type'])
-                                if type_name == 'service_description':
-                                    logger.info("- %s: %s/%s",
-                                                ws['type'], item['host_name'], item[type_name])
-                                else:
-                                    logger.info("- %s: %s",
-                                                ws['type'], item[type_name])
-                            type_list = ws.get('type_list', '%ss' % ws['type'])
-                            result[type_list].append(item)
-                            logger.info("- %s: %s", ws['type'], item)
-                except xc.Fault as exp:
-                    logger.error("XML RPC fault: %s / %s",
-                                 exp.faultCode, exp.faultString)
-                except xc.ProtocolError as exp:
-                    logger.error("XML RPC protocol error: %s / %s, url: %s",
-                                 exp.errcode, exp.errmsg, exp.url)
-                except Exception as exp:
-                    logger.error("Exception when getting tag '%s': %s / %s", entity, type(exp),
-                                 str(exp))
-                    logger.error(traceback.print_exc())
+        return list(zip([entity.strip() for entity in self.entities], fetched))
 
-        # Group services and services templates
-        result['services'] = result['servicestemplates'] + result['services']
-        del result['servicestemplates']
+    def _timeouts_report(self):
+        """Get the timed out object types per entity
+
+        :return: report string, eg: entity-0: host, service; entity-1: service
+        """
+        report = {}
+        for entity, object_type in self.timeouts:
+            report.setdefault(entity or 'all entities', []).append(object_type)
+        return '; '.join('%s: %s' % (entity, ', '.join(report[entity]))
+                         for entity in sorted(report))
+
+    def _get_result(self, fetched, hashes=None):
+        """Build the objects list provided to the arbiter
+
+        :param fetched: list of (entity, objects) tuples as returned by _fetch_objects
+        :param hashes: objects hashes if they are already known, see content_hashes
+        :return: objects per type
+        """
+        with measure(self._profile, 'assembly'):
+            self._detect_changes(fetched, hashes)
+            result = self._merge_result(fetched)
+            if self.diff_report:
+                self._report_diff(result)
+            # The arbiter gets dictionaries, the compact records are only used while importing
+            result = dict((object_type, [to_dict(item) for item in items])
+                          for object_type, items in result.items())
 
         logger.info("Returned data:")
         for ws in result:
             logger.info("- %d %s", len(result[ws]), ws)
 
         return result
+
+    def _merge_result(self, fetched):
+        """Merge the objects of all the entities
+
+        :param fetched: list of (entity, objects) tuples as returned by _fetch_objects
+        :return: objects per type
+        """
+        result = {
+            'commands': [],
+            'realms': [],
+            'hosts': [],
+            'hostgroups': [],
+            'servicestemplates': [],
+            'services': [],
+            'contacts': [],
+            'timeperiods': []
+        }
+
+        # Merge in the entities order to get the same result as when fetching sequentially
+        index = {}
+        with measure(self._profile, 'deduplication'):
+            for _, objects in fetched:
+                self._merge_objects(result, objects, index)
+
+        # Group services and services templates
+        result['services'] = result['servicestemplates'] + result['services']
+        del result['servicestemplates']
+
+        return result
+
+    def _detect_changes(self, fetched, hashes=None):
+        """Compare the objects with the ones of the last import
+
+        The configuration is changed if the objects hash of an entity and type changed.
+        If no previous import is known, the configuration is changed.
+
+        The result is published with the glpi.changed metric and in the changes file.
+
+        :param fetched: list of (entity, objects) tuples as returned by _fetch_objects
+        :param hashes: objects hashes if they are already known, see content_hashes
+        :return: None
+        """
+        if not self.change_detection:
+            return
+        if hashes is None:
+            hashes = content_hashes(fetched, self.volatile_fields)
+        if self.content_hashes is None:
+            self.changed = True
+            self.changes = {}
+            logger.info("No previous import, the configuration is considered as changed")
+        else:
+            self.changes = compare_hashes(self.content_hashes, hashes)
+            changed = sorted(object_type for object_type in self.changes
+                             if self.changes[object_type]['changed'])
+            self.changed = bool(changed)
+            if changed:
+                logger.info("Configuration changed since the last import:")
+                for object_type in changed:
+                    logger.info("- %ss: %d -> %d objects, entities: %s", object_type,
+                                self.changes[object_type]['previous_count'],
+                                self.changes[object_type]['count'],
+                                ', '.join(self.changes[object_type]['entities']))
+            else:
+                logger.info("Configuration unchanged since the last import")
+        self.content_hashes = hashes
+
+        self.statsmgr.gauge('glpi.changed', 1 if self.changed else 0)
+        if self.changes_file:
+            try:
+                write_report(self.changes_file, {'timestamp': time.time(),
+                                                 'changed': self.changed,
+                                                 'changes': self.changes})
+            except (IOError, OSError, TypeError, ValueError) as exp:
+                logger.error("Could not write the changes file %s: %s",
+                             self.changes_file, str(exp))
+
+    def _object_name(self, type_list, item):
+        """Get the name of an object provided to the arbiter
+
+        :param type_list: objects type, as in the get_objects result
+        :param item: object
+        :return: object name, the host and service names joined with a / for a service,
+        template/name for a template
+        """
+        for ws in self.ws:
+            if ws.get('type_list', '%ss' % ws['type']) == type_list:
+                key = self._natural_key(ws, item)
+                break
+        else:
+            key = None
+        if isinstance(key, tuple):
+            return '/'.join(part or '' for part in key)
+        if key is None:
+            # No name, identify the object with all its properties
+            return canonical_item(item, self.volatile_fields)
+        return key
+
+    def _report_diff(self, result):
+        """Compare the objects with the last provided ones and write the changes report
+
+        :param result: objects per type, as returned by get_objects
+        :return: None
+        """
+        previous, self.last_objects = self.last_objects, result
+        if previous is None:
+            logger.info("No previous import, no changes report")
+            return
+
+        start = time.time()
+        self.diff = {}
+        # Not compared if the objects hashes did not change
+        if self.changed is not False:
+            self.diff = diff_objects(previous, result, self._object_name, self.volatile_fields)
+        report = {
+            'timestamp': time.time(),
+            'changed': bool(self.diff),
+            'summary': dict((object_type, dict((change, len(self.diff[object_type][change]))
+                                               for change in self.diff[object_type]))
+                            for object_type in self.diff),
+            'objects': self.diff
+        }
+        try:
+            write_report(self.diff_report, report)
+            logger.info("Changes report written in %.3f seconds: %s",
+                        time.time() - start, self.diff_report)
+        except (IOError, OSError, TypeError, ValueError) as exp:
+            logger.error("Could not write the changes report %s: %s", self.diff_report, str(exp))
+
+    def _write_profile(self, profile):
+        """Log and write the import profile report
+
+        :param profile: ImportProfile of the import
+        :return: None
+        """
+        self.last_profile = profile.report()
+        lines = profile.format()
+        for line in lines:
+            logger.info(line)
+        try:
+            write_report(self.profile_report + '.json', self.last_profile)
+            with open(self.profile_report + '.txt', 'w') as fp:
+                fp.write('\n'.join(lines) + '\n')
+        except (IOError, OSError) as exp:
+            logger.error("Could not write the profile report %s: %s",
+                         self.profile_report, str(exp))
@@ -0,0 +1,144 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017-2019:
+#    Frederic Mohier, frederic.mohier@gmail.com
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module profiles the configuration import: the import duration is broken down
+into categories (network, unmarshalling, logging, ...).
+"""
+import time
+import threading
+from contextlib import contextmanager
+
+# Categories in the report order
+CATEGORIES = [
+    ('network', "waiting for the Glpi web services responses"),
+    ('unmarshalling', "parsing the responses"),
+    ('decompression', "decompressing the responses"),
+    ('fetch', "waiting for the workers and preparing the requests"),
+    ('deduplication', "merging the objects of the entities"),
+    ('assembly', "changes detection and result assembly"),
+    ('snapshot', "loading and saving the snapshot"),
+    ('logging', "formatting and writing the logs"),
+    ('other', "anything else"),
+]
+
+
+class ImportProfile(object):
+    """
+    Durations of the import per category
+
+    A measured duration excludes the nested measures of the same thread: the time spent
+    parsing a response is not counted in the network time. The durations of all the
+    threads are cumulated, so their sum is greater than the import duration when the
+    web services are requested concurrently.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.times = {}
+        self.calls = {}
+        self.start = time.time()
+        self.wall_time = 0.0
+
+    @contextmanager
+    def measure(self, category):
+        """Measure the duration of a block
+
+        :param category: duration category
+        """
+        stack = self._local.__dict__.setdefault('stack', [])
+        # [nested measures duration]
+        frame = [0.0]
+        stack.append(frame)
+        start = time.time()
+        try:
+            yield
+        finally:
+            duration = time.time() - start
+            stack.pop()
+            if stack:
+                stack[-1][0] += duration
+            self.add(category, duration - frame[0])
+
+    def add(self, category, duration):
+        """Count a duration
+
+        :param category: duration category
+        :param duration: duration in seconds
+        :return: None
+        """
+        with self._lock:
+            self.times[category] = self.times.get(category, 0.0) + duration
+            self.calls[category] = self.calls.get(category, 0) + 1
+
+    def stop(self):
+        """End of the import"""
+        self.wall_time = time.time() - self.start
+
+    def report(self):
+        """Get the profile report
+
+        :return: {'wall_time': import duration, 'cumulated_time': sum of the durations,
+        'categories': {category: {'time': duration, 'calls': count, 'percent': part of
+        the cumulated time}}}
+        """
+        cumulated = sum(self.times.values())
+        return {
+            'start': self.start,
+            'wall_time': self.wall_time,
+            'cumulated_time': cumulated,
+            'categories': dict((category, {
+                'time': self.times[category],
+                'calls': self.calls[category],
+                'percent': 100.0 * self.times[category] / cumulated if cumulated else 0.0
+            }) for category in self.times)
+        }
+
+    def format(self):
+        """Get a human readable profile report
+
+        :return: report lines
+        """
+        report = self.report()
+        lines = ["Glpi import profile: %.3f seconds, %.3f seconds cumulated over the threads"
+                 % (report['wall_time'], report['cumulated_time'])]
+        for category, description in CATEGORIES:
+            if category in report['categories']:
+                values = report['categories'][category]
+                lines.append("- %-14s %9.3f s %5.1f %% %7d calls  %s"
+                             % (category, values['time'], values['percent'],
+                                values['calls'], description))
+        return lines
+
+
+@contextmanager
+def measure(profile, category):
+    """Measure the duration of a block if a profile is provided
+
+    :param profile: ImportProfile or None
+    :param category: duration category
+    """
+    if profile is None:
+        yield
+        return
+    with profile.measure(category):
+        yield
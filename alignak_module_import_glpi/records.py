@@ -0,0 +1,156 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017-2019:
+#    Frederic Mohier, frederic.mohier@gmail.com
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module stores the imported objects in a compact form while they are imported.
+
+The unmarshalled objects are dictionaries that each hold their own keys table and their
+own copy of the repeated values (host_name, use, check_command, ...). The objects of a
+type mostly have the same properties: the records share the keys table of the objects
+with the same properties and only store a tuple of (interned) values. The records are
+converted to dictionaries when the objects are provided to the arbiter.
+"""
+from six.moves import intern
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping  # pylint: disable=deprecated-class
+
+
+def _intern(value):
+    """Intern a string value so that the equal values of all the objects are shared"""
+    if isinstance(value, str):
+        return intern(value)
+    return value
+
+
+class Layout(object):  # pylint: disable=too-few-public-methods
+    """The properties of some records: the keys and the position of their values"""
+    __slots__ = ('keys', 'positions')
+
+    def __init__(self, keys):
+        self.keys = tuple(_intern(key) for key in keys)
+        self.positions = dict((key, position) for position, key in enumerate(self.keys))
+
+
+class Record(Mapping):
+    """
+    A read-only object, like a dictionary, which values are stored in a tuple
+
+    The keys are stored in the layout shared by the records with the same properties.
+    """
+    __slots__ = ('_layout', '_values')
+
+    def __init__(self, layout, values):
+        self._layout = layout
+        self._values = values
+
+    def __getitem__(self, key):
+        return self._values[self._layout.positions[key]]
+
+    def __iter__(self):
+        return iter(self._layout.keys)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, key):
+        return key in self._layout.positions
+
+    def __eq__(self, other):
+        if isinstance(other, Record) and other._layout is self._layout:
+            return self._values == other._values
+        return Mapping.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def to_dict(self):
+        """Get the object as a dictionary
+
+        :return: object properties
+        """
+        return dict(zip(self._layout.keys, self._values))
+
+
+class RecordType(object):
+    """
+    The records of the objects of a type
+
+    The layouts of the objects properties are created on the first object having these
+    properties and kept for the next imports.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.layouts = {}
+
+    def record(self, item):
+        """Get the compact record of an object
+
+        :param item: object properties, as unmarshalled
+        :return: Record, the item itself if it is not a dictionary
+        """
+        if not isinstance(item, dict):
+            return item
+        keys = tuple(item)
+        layout = self.layouts.get(keys)
+        if layout is None:
+            layout = self.layouts.setdefault(keys, Layout(keys))
+        return Record(layout, tuple(_intern(value) for value in item.values()))
+
+    def records(self, items):
+        """Get the compact records of a list of objects
+
+        :param items: list of objects, may be None
+        :return: list of records, None if items is None
+        """
+        if items is None:
+            return None
+        return [self.record(item) for item in items]
+
+
+def to_dict(item):
+    """Get an object as a dictionary, as provided to the arbiter
+
+    :param item: Record or dictionary
+    :return: object properties
+    """
+    if isinstance(item, Record):
+        return item.to_dict()
+    return item
+
+
+def json_default(value):
+    """Serialize the records as JSON objects, the other unknown values as strings
+
+    :param value: value that the json module does not serialize
+    :return: serializable value
+    """
+    if isinstance(value, Record):
+        return value.to_dict()
+    return str(value)
@@ -0,0 +1,191 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017-2019:
+#    Frederic Mohier, frederic.mohier@gmail.com
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module makes the Glpi web services requests resilient to transient errors.
+
+The requests failing on a transient error (connection error, overloaded server) are
+retried after a jittered exponential backoff. A circuit breaker suspends the requests
+after consecutive failures, so that an overloaded Glpi is not flooded with requests.
+"""
+import time
+import random
+import socket
+import threading
+
+from .transport import xc
+
+try:
+    from httplib import HTTPException
+except ImportError:
+    from http.client import HTTPException
+
+# HTTP status of an overloaded or unavailable server
+TRANSIENT_STATUS = (408, 429, 502, 503, 504)
+
+
+class CircuitOpenError(Exception):
+    """The circuit breaker is open, the request is not sent"""
+
+
+def is_transient(exp):
+    """Tell if a request error is transient and the request may be retried
+
+    The timed out requests are not retried: a timeout is a slow Glpi that would not
+    respond faster to a retried request.
+
+    :param exp: raised exception
+    :return: True for the connection errors and the overloaded server errors
+    """
+    if isinstance(exp, socket.timeout):
+        return False
+    if isinstance(exp, xc.ProtocolError):
+        return exp.errcode in TRANSIENT_STATUS
+    return isinstance(exp, (socket.error, HTTPException))
+
+
+def is_failure(exp):
+    """Tell if a request error is a Glpi failure counted by the circuit breaker
+
+    A Fault is not a failure: Glpi is available and responded.
+
+    :param exp: raised exception
+    :return: True for the transient errors and the timeouts
+    """
+    return isinstance(exp, socket.timeout) or is_transient(exp)
+
+
+class RetryPolicy(object):
+    """
+    Retries of the failed requests
+
+    The delay before the retry n (starting from 0) is a random duration between 0 and
+    backoff * 2^n seconds, at most max_backoff seconds ("full jitter"). The randomness
+    spreads the retries of the concurrent requests.
+    """
+
+    def __init__(self, retries=2, backoff=0.5, max_backoff=10.0, seed=None):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._random = random.Random(seed)
+
+    def delay(self, attempt):
+        """Get the delay before a retry
+
+        :param attempt: retry number, starting from 0
+        :return: delay in seconds
+        """
+        return self._random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def retry_delay(self, exp, attempt, deadline=None):
+        """Get the delay before retrying a failed request
+
+        :param exp: raised exception
+        :param attempt: retry number, starting from 0
+        :param deadline: time after which the request must not be retried, if set
+        :return: delay in seconds, None if the request must not be retried
+        """
+        if attempt >= self.retries or not is_transient(exp):
+            return None
+        delay = self.delay(attempt)
+        if deadline and time.time() + delay >= deadline:
+            return None
+        return delay
+
+
+class CircuitBreaker(object):
+    """
+    Suspend the requests while Glpi is failing
+
+    - closed: the requests are sent
+    - open: after `threshold` consecutive failures, the requests are rejected with a
+    CircuitOpenError for `reset_timeout` seconds
+    - half-open: then one request is sent to probe Glpi, the circuit is closed if it
+    succeeds and opened again if it fails. Another probe is sent if the result of the
+    probe is not recorded within reset_timeout seconds (eg. cancelled request)
+
+    `on_open` is called with the consecutive failures count when the circuit opens.
+    The circuit breaker may be shared by several threads.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, threshold=5, reset_timeout=30.0, on_open=None):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.on_open = on_open
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        # Start time of the probe request, 0 if none is in flight
+        self._probing = 0
+        self._lock = threading.Lock()
+
+    def before(self):
+        """Check that a request may be sent
+
+        Raise CircuitOpenError if the circuit is open.
+
+        :return: None
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self.opened + self.reset_timeout - time.time()
+                if remaining > 0:
+                    raise CircuitOpenError("Glpi requests suspended for %.0f seconds after "
+                                           "%d failures" % (remaining, self.failures))
+                self.state = self.HALF_OPEN
+                self._probing = 0
+            if self.state == self.HALF_OPEN:
+                if self._probing and time.time() - self._probing < self.reset_timeout:
+                    raise CircuitOpenError("Glpi requests suspended while probing Glpi")
+                self._probing = time.time()
+
+    def record(self, exp=None):
+        """Record the result of a request
+
+        :param exp: raised exception, None if the request succeeded
+        :return: None
+        """
+        if isinstance(exp, CircuitOpenError):
+            # The request was not sent
+            return
+        opened = False
+        with self._lock:
+            if exp is None or not is_failure(exp):
+                self.state = self.CLOSED
+                self.failures = 0
+                self._probing = 0
+                return
+
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and
+                                                self.failures >= self.threshold):
+                self.state = self.OPEN
+                self.opened = time.time()
+                self._probing = 0
+                opened = True
+            failures = self.failures
+
+        if opened and self.on_open is not None:
+            self.on_open(failures)
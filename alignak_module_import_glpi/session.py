@@ -0,0 +1,135 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017-2019:
+#    Frederic Mohier, frederic.mohier@gmail.com
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module stores the Glpi session in a local file, so that the session opened by a
+module instance is reused by the next one (eg. after an arbiter reload) rather than
+logging in again.
+"""
+import os
+import re
+import json
+import time
+
+from .transport import xc
+
+
+def is_session_expired(exp, pattern):
+    """Tell if a request failed because the Glpi session expired or was closed
+
+    :param exp: raised exception
+    :param pattern: compiled regular expression searched in the fault string
+    :return: True for a fault matching the pattern
+    """
+    return isinstance(exp, xc.Fault) and pattern.search(exp.faultString or '') is not None
+
+
+def session_pattern(expression):
+    """Compile the regular expression matching the session expiry faults
+
+    :param expression: regular expression, case insensitive
+    :return: compiled regular expression
+    """
+    return re.compile(expression, re.IGNORECASE)
+
+
+class SessionStore(object):
+    """
+    The Glpi session of a Glpi uri and login, stored in a file
+
+    The file content is:
+    {
+        'uri': Glpi WS uri,
+        'login_name': Glpi user,
+        'session': session token,
+        'used': last time the session was used
+    }
+
+    A stored session is only valid for the same uri and login and while it was used less
+    than `ttl` seconds ago: Glpi closes the sessions that are not used. The file is only
+    readable by its owner, the session token is a credential.
+    """
+
+    def __init__(self, path, uri, login_name, ttl):
+        self.path = path
+        self.uri = uri
+        self.login_name = login_name
+        self.ttl = ttl
+
+    def load(self):
+        """Load the stored session
+
+        Raise an IOError or a ValueError if the session file is not valid.
+
+        :return: the session token, None if no valid session is stored
+        """
+        if not os.path.exists(self.path):
+            return None
+
+        with open(self.path, 'r') as fp:
+            stored = json.load(fp)
+
+        for key in ['uri', 'login_name']:
+            if stored.get(key) != getattr(self, key):
+                raise ValueError("stored session %s does not match the module "
+                                 "configuration: %s" % (key, stored.get(key)))
+        if time.time() - stored['used'] >= self.ttl:
+            return None
+
+        return stored['session']
+
+    def save(self, session, used=None):
+        """Store a session
+
+        The file is written atomically. Raise an IOError if the session file cannot be
+        written.
+
+        :param session: session token
+        :param used: last time the session was used, default is now
+        :return: None
+        """
+        stored = {
+            'uri': self.uri,
+            'login_name': self.login_name,
+            'session': session,
+            'used': used or time.time()
+        }
+
+        temp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        try:
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(stored, fp)
+            os.rename(temp_path, self.path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def clear(self):
+        """Remove the stored session
+
+        :return: None
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,132 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017-2019:
+#    Frederic Mohier, frederic.mohier@gmail.com
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module stores the configuration imported from Glpi in a local file to avoid
+requesting Glpi on each arbiter configuration load.
+"""
+import os
+import json
+import time
+import hashlib
+
+from .records import json_default
+
+
+class GlpiSnapshot(object):
+    """
+    A snapshot of the configuration imported from a Glpi instance
+
+    The snapshot file name is built from the Glpi uri, the monitoring framework tag and
+    the Alignak instance name so that several module instances may share the same
+    directory. The snapshot content is:
+    {
+        'uri': Glpi WS uri,
+        'tag': monitoring framework tag,
+        'alignak_name': Alignak instance name,
+        'timestamp': import time,
+        'full_timestamp': last full (not incremental) import time,
+        'entities': [
+            {
+                'entity': entity tag,
+                'objects': {object type: [items]},
+                'updated': {object type: objects import time}
+            },
+            ...
+        ]
+    }
+    """
+
+    def __init__(self, directory, uri, tag, alignak_name):
+        self.uri = uri
+        self.tag = tag
+        self.alignak_name = alignak_name
+
+        key = hashlib.sha1(('%s|%s|%s' % (uri, tag, alignak_name)).encode('utf-8'))
+        self.path = os.path.join(directory, 'glpi-snapshot-%s.json' % key.hexdigest())
+
+    def load(self):
+        """Load the snapshot from the disk
+
+        Raise an IOError or a ValueError if the snapshot file is not valid.
+
+        :return: the snapshot, None if no snapshot exists
+        """
+        if not os.path.exists(self.path):
+            return None
+
+        with open(self.path, 'r') as fp:
+            snapshot = json.load(fp)
+
+        for key in ['uri', 'tag', 'alignak_name']:
+            if snapshot.get(key) != getattr(self, key):
+                raise ValueError("snapshot %s does not match the module configuration: %s"
+                                 % (key, snapshot.get(key)))
+
+        return snapshot
+
+    def save(self, entities, timestamp=None, full_timestamp=None, hashes=None):
+        """Save a snapshot to the disk
+
+        The file is written atomically to never leave a partial snapshot. Raise an
+        IOError if the snapshot file cannot be written.
+
+        :param entities: list of (entity, {object type: [items]}, {object type: time}) tuples
+        :param timestamp: import time, default is now
+        :param full_timestamp: last full import time, default is the import time
+        :param hashes: objects hashes of the entities, stored if they are set
+        :return: the saved snapshot
+        """
+        timestamp = timestamp or time.time()
+        snapshot = {
+            'uri': self.uri,
+            'tag': self.tag,
+            'alignak_name': self.alignak_name,
+            'timestamp': timestamp,
+            'full_timestamp': full_timestamp or timestamp,
+            'entities': [{'entity': entity, 'objects': objects, 'updated': updated}
+                         for entity, objects, updated in entities]
+        }
+        if hashes is not None:
+            snapshot['hashes'] = hashes
+
+        temp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        try:
+            with open(temp_path, 'w') as fp:
+                json.dump(snapshot, fp, default=json_default)
+            os.rename(temp_path, self.path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        return snapshot
+
+    @staticmethod
+    def age(snapshot):
+        """Get the age of a snapshot
+
+        :param snapshot: a loaded snapshot
+        :return: age in seconds
+        """
+        return time.time() - snapshot['timestamp']
@@ -0,0 +1,376 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017-2019:
+#    Frederic Mohier, frederic.mohier@gmail.com
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module contains the XML-RPC transport used to dialog with the Glpi web services.
+"""
+import ssl
+import time
+import zlib
+import threading
+from contextlib import contextmanager
+
+from .profiler import measure
+
+try:
+    import xmlrpclib as xc
+    from httplib import HTTPConnection, HTTPSConnection
+except ImportError:
+    import xmlrpc.client as xc
+    from http.client import HTTPConnection, HTTPSConnection
+
+# TLS session resumption is available since Python 3.6
+TLS_SESSION = hasattr(ssl.SSLSocket, 'session')
+
+
+class TransferStats(object):
+    """Data transferred by the transports, shared by several threads
+
+    The received bytes and the retried requests are also counted per thread to get
+    the counters of a request, see `take`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.received = 0
+        self.decoded = 0
+        self.decompress_time = 0.0
+
+    def add(self, received, decoded, decompress_time):
+        """Count the data of a response
+
+        :param received: bytes received on the wire
+        :param decoded: bytes after decompression
+        :param decompress_time: decompression duration
+        :return: None
+        """
+        with self._lock:
+            self.received += received
+            self.decoded += decoded
+            self.decompress_time += decompress_time
+        self._local.received = getattr(self._local, 'received', 0) + received
+
+    def retry(self, count=1):
+        """Count the retried requests of the current thread
+
+        :param count: retried requests count
+        :return: None
+        """
+        self._local.retries = getattr(self._local, 'retries', 0) + count
+
+    def take(self):
+        """Get and reset the counters of the current thread
+
+        :return: (received bytes, retried requests) since the last call
+        """
+        counters = (getattr(self._local, 'received', 0), getattr(self._local, 'retries', 0))
+        self._local.received = self._local.retries = 0
+        return counters
+
+    def reset(self):
+        """Reset the counters
+
+        :return: (received, decoded, decompress_time) before the reset
+        """
+        with self._lock:
+            counters = (self.received, self.decoded, self.decompress_time)
+            self.received = self.decoded = 0
+            self.decompress_time = 0.0
+        return counters
+
+
+def read_response(response, feed, stats=None, read_size=65536, profile=None):
+    """Read an HTTP response body and decode it if it is gzip compressed
+
+    :param response: HTTP response
+    :param feed: callable that receives the decoded body chunks
+    :param stats: TransferStats to count the transferred data
+    :param read_size: size of the read chunks
+    :param profile: ImportProfile measuring the decompression and feeding durations
+    :return: None
+    """
+    decompressor = None
+    if hasattr(response, 'getheader') and \
+            response.getheader('Content-Encoding', '') == 'gzip':
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    received = decoded = 0
+    decompress_time = 0.0
+    while True:
+        data = response.read(read_size)
+        if not data:
+            break
+        received += len(data)
+        if decompressor is not None:
+            start = time.time()
+            with measure(profile, 'decompression'):
+                data = decompressor.decompress(data)
+            decompress_time += time.time() - start
+        decoded += len(data)
+        with measure(profile, 'unmarshalling'):
+            feed(data)
+    if decompressor is not None:
+        data = decompressor.flush()
+        decoded += len(data)
+        feed(data)
+
+    if stats is not None:
+        stats.add(received, decoded, decompress_time)
+
+
+class TransportMixin(object):
+    """
+    Transport mixin that:
+    - decodes the gzip compressed responses and counts the transferred data in the
+    `stats` object if it is set
+
+    The transport of a server proxy must not be shared between threads.
+    """
+    stats = None
+    # Response read size
+    read_size = 65536
+    # Attempts of the current request
+    _attempts = 0
+    # ImportProfile measuring the responses parsing
+    profile = None
+    # Read timeout of the current request, the transport read_timeout if not set
+    call_timeout = None
+
+    def request(self, host, handler, request_body, verbose=False):
+        """Send a request, the transport retries once if the connection was closed"""
+        self._attempts = 0
+        try:
+            return xc.Transport.request(self, host, handler, request_body, verbose)
+        finally:
+            if self._attempts > 1 and self.stats is not None:
+                self.stats.retry(self._attempts - 1)
+
+    def single_request(self, host, handler, request_body, verbose=False):
+        """Send a request once"""
+        self._attempts += 1
+        set_read_timeout(self.make_connection(host),
+                         self.call_timeout or self.read_timeout)  # pylint: disable=no-member
+        return xc.Transport.single_request(self, host, handler, request_body, verbose)
+
+    def parse_response(self, response):
+        """Read and parse a response"""
+        parser, unmarshaller = self.getparser()
+
+        def feed(data):
+            """Feed the parser with the response data"""
+            if self.verbose:  # pylint: disable=no-member
+                print("body: %r" % data)
+            parser.feed(data)
+
+        read_response(response, feed, self.stats, self.read_size, self.profile)
+        with measure(self.profile, 'unmarshalling'):
+            parser.close()
+            return unmarshaller.close()
+
+
+class TimeoutHTTPConnection(HTTPConnection):
+    """HTTP connection with distinct connection and read timeouts"""
+
+    def __init__(self, host, read_timeout=None, **kwargs):
+        HTTPConnection.__init__(self, host, **kwargs)
+        self.read_timeout = read_timeout
+
+    def connect(self):
+        HTTPConnection.connect(self)
+        # Always replace the connection timeout, None is no read timeout
+        self.sock.settimeout(self.read_timeout)
+
+
+class TimeoutHTTPSConnection(HTTPSConnection):
+    """HTTPS connection with distinct connection and read timeouts
+
+    The TLS session of the last connection is stored in the `tls_sessions` object
+    to resume it on the next connection rather than doing a full handshake.
+    """
+
+    def __init__(self, host, read_timeout=None, tls_sessions=None, **kwargs):
+        HTTPSConnection.__init__(self, host, **kwargs)
+        self.read_timeout = read_timeout
+        self.tls_sessions = tls_sessions
+
+    def connect(self):
+        # pylint: disable=no-member
+        HTTPConnection.connect(self)
+        server_hostname = self._tunnel_host or self.host
+        if TLS_SESSION and self.tls_sessions is not None and self.tls_sessions.session:
+            self.sock = self._context.wrap_socket(self.sock, server_hostname=server_hostname,
+                                                  session=self.tls_sessions.session)
+        else:
+            self.sock = self._context.wrap_socket(self.sock, server_hostname=server_hostname)
+        self._store_session()
+        # Always replace the connection timeout, None is no read timeout
+        self.sock.settimeout(self.read_timeout)
+
+    def getresponse(self, *args, **kwargs):
+        response = HTTPSConnection.getresponse(self, *args, **kwargs)
+        # With TLS 1.3, the session is only available once some data is received
+        self._store_session()
+        return response
+
+    def _store_session(self):
+        if TLS_SESSION and self.tls_sessions is not None and self.sock is not None \
+                and self.sock.session and self.sock.session != self.tls_sessions.session:
+            self.tls_sessions.session = self.sock.session
+
+
+def set_read_timeout(connection, timeout):
+    """Set the read timeout of a connection, it applies to the open socket
+
+    :param connection: TimeoutHTTPConnection or TimeoutHTTPSConnection
+    :param timeout: read timeout in seconds, None for no timeout
+    :return: None
+    """
+    if timeout == connection.read_timeout:
+        return
+    connection.read_timeout = timeout
+    if connection.sock is not None:
+        connection.sock.settimeout(timeout)
+
+
+class TlsSessions(object):  # pylint: disable=too-few-public-methods
+    """Last TLS session of a server"""
+
+    def __init__(self):
+        self.session = None
+
+
+def _connection_parameters(transport):
+    """Get the HTTP connection parameters of a transport"""
+    parameters = {'read_timeout': transport.read_timeout}
+    if transport.connect_timeout:
+        parameters['timeout'] = transport.connect_timeout
+    return parameters
+
+
+class GlpiTransport(TransportMixin, xc.Transport):
+    """HTTP transport for the Glpi web services
+
+    The connection is kept alive between the requests.
+    """
+
+    def __init__(self, connect_timeout=None, read_timeout=None):
+        xc.Transport.__init__(self)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+    def make_connection(self, host):
+        # Return the existing connection for HTTP/1.1 keep-alive
+        if self._connection and host == self._connection[0]:
+            return self._connection[1]
+
+        chost, self._extra_headers, _ = self.get_host_info(host)
+        self._connection = host, TimeoutHTTPConnection(chost, **_connection_parameters(self))
+        return self._connection[1]
+
+
+class GlpiSafeTransport(TransportMixin, xc.SafeTransport):
+    """HTTPS transport for the Glpi web services
+
+    The connection is kept alive between the requests. The transports sharing the same
+    SSL context and TLS sessions store resume the TLS sessions.
+    """
+
+    def __init__(self, connect_timeout=None, read_timeout=None, context=None,
+                 tls_sessions=None):
+        xc.SafeTransport.__init__(self, context=context)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.tls_sessions = tls_sessions
+
+    def make_connection(self, host):
+        # Return the existing connection for HTTP/1.1 keep-alive
+        if self._connection and host == self._connection[0]:
+            return self._connection[1]
+
+        chost, self._extra_headers, x509 = self.get_host_info(host)
+        parameters = _connection_parameters(self)
+        parameters.update(x509 or {})
+        self._connection = host, TimeoutHTTPSConnection(
+            chost, context=self.context, tls_sessions=self.tls_sessions, **parameters)
+        return self._connection[1]
+
+
+class ConnectionPool(object):
+    """
+    A pool of connections to the Glpi web services
+
+    The connections are created by the `factory` callable and they must have a `close`
+    method. They keep their HTTP connection alive. A connection is used by one thread at
+    a time: it is acquired from the pool and released to the pool when the request is
+    complete. At most `size` idle connections are kept, more connections are opened if
+    needed and closed on release.
+    """
+
+    def __init__(self, factory, size=4):
+        self.factory = factory
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Get an idle connection, or a new one if none is available
+
+        :return: connection
+        """
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self.factory()
+
+    def release(self, con, discard=False):
+        """Give back a connection to the pool
+
+        :param con: connection
+        :param discard: close the connection rather than keeping it
+        :return: None
+        """
+        with self._lock:
+            if not discard and len(self._idle) < self.size:
+                self._idle.append(con)
+                return
+        con.close()
+
+    @contextmanager
+    def connection(self):
+        """Use a connection of the pool
+
+        The connection is discarded if an error occurs while it is used.
+        """
+        con = self.acquire()
+        try:
+            yield con
+        except Exception:
+            self.release(con, discard=True)
+            raise
+        self.release(con)
+
+    def close(self):
+        """Close all the idle connections"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for con in idle:
+            con.close()
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2019: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Benchmark the configuration import from a (fake) Glpi
+
+The fake Glpi runs in its own process so that it does not share the CPU and the
+memory measures of the module. Run from the repository root directory:
+    python -m test.benchmark_import --entities 10 --hosts 1000 --services 5
+    python -m test.benchmark_import --parameter max_workers=4 --parameter backend=json
+    python -m test.benchmark_import --realistic --entities 100 --hosts 1000
+    python -m test.benchmark_import --records --entities 10 --hosts 1000 --services 10
+
+The results may be saved (--output) and compared with saved results (--baseline): the
+benchmark fails if the throughput is lower than the baseline one minus the tolerance.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import multiprocessing
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+import resource
+
+from alignak.objects.module import Module
+
+import alignak_module_import_glpi
+from alignak_module_import_glpi.records import RecordType
+from alignak_module_import_glpi.transport import xc
+
+from .fake_glpi import FakeGlpi, make_data
+from .glpi_dataset import generate
+
+
+class StatsRecorder(object):
+    """Record the metrics sent by the module"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def timer(self, key, value, *args):
+        self.metrics.append((key, value))
+
+    def counter(self, key, value, *args):
+        self.metrics.append((key, value))
+
+    def gauge(self, key, value, *args):
+        self.metrics.append((key, value))
+
+
+def get_data(args):
+    """Build the fake Glpi configuration"""
+    if args.realistic:
+        return generate(args.entities, args.hosts, args.services, seed=args.seed)
+    return make_data(args.entities, args.hosts, args.services or 1, args.payload)
+
+
+def serve(queue, args):
+    """Serve the fake Glpi, in a child process"""
+    glpi = FakeGlpi(get_data(args), multicall=True)
+    glpi.delay = args.latency
+    queue.put(glpi.uri)
+    glpi.server.serve_forever()
+
+
+def get_instance(uri, parameters):
+    """Get a module instance for the fake Glpi"""
+    configuration = {
+        'module_alias': 'import-glpi',
+        'module_types': 'configuration',
+        'python_name': 'alignak_module_import_glpi',
+        'uri': uri
+    }
+    configuration.update(parameters)
+    return alignak_module_import_glpi.get_instance(Module(configuration))
+
+
+def percentile(values, percent):
+    """Get a percentile of some values (nearest rank)"""
+    values = sorted(values)
+    if not values:
+        return 0.0
+    rank = max(0, int(round(percent / 100.0 * len(values))) - 1)
+    return values[min(rank, len(values) - 1)]
+
+
+def benchmark_import(uri, parameters, repeat):
+    """Import time, throughput and web services latency"""
+    durations = []
+    latencies = []
+    objects = 0
+    for _ in range(repeat):
+        instance = get_instance(uri, parameters)
+        instance.statsmgr = stats = StatsRecorder()
+        start = time.time()
+        instance.init()
+        result = instance.get_objects()
+        durations.append(time.time() - start)
+        objects = sum(len(items) for items in result.values())
+        latencies.extend(value for key, value in stats.metrics
+                         if key.startswith('glpi.') and key.endswith('.time'))
+
+    return {
+        'objects': objects,
+        'imports': repeat,
+        'best_time': min(durations),
+        'median_time': percentile(durations, 50),
+        'throughput': objects / min(durations),
+        'calls': len(latencies),
+        'latency_p50': percentile(latencies, 50),
+        'latency_p90': percentile(latencies, 90),
+        'latency_p99': percentile(latencies, 99),
+        'latency_max': max(latencies) if latencies else 0.0,
+    }
+
+
+def benchmark_memory(uri, parameters):
+    """Memory allocated by an import
+
+    With Python 3, the peak of the memory allocated by the import. Else the maximum
+    resident size of the benchmark process.
+    """
+    instance = get_instance(uri, parameters)
+    instance.init()
+    if tracemalloc is None:
+        instance.get_objects()
+        # Kilobytes on Linux
+        return {'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+
+    tracemalloc.start()
+    try:
+        instance.get_objects()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'peak_memory': peak}
+
+
+def benchmark_records(args):
+    """Memory used by the imported objects, as unmarshalled and as compact records
+
+    The objects of each type of all the entities are unmarshalled from an XML-RPC
+    response, as received from Glpi, then converted to records.
+    """
+    if tracemalloc is None:
+        print("The records memory benchmark requires tracemalloc (Python 3)")
+        return {}
+
+    data = get_data(args)
+    results = {}
+    for object_type in sorted(set(object_type for entity in data.values()
+                                  for object_type in entity)):
+        items = [item for entity in sorted(data)
+                 for item in data[entity].get(object_type, [])]
+        response = xc.dumps((items, ), methodresponse=True)
+        del items
+        record_type = RecordType(object_type)
+
+        tracemalloc.start()
+        try:
+            unmarshalled = xc.loads(response)[0][0]
+            dicts = tracemalloc.get_traced_memory()[0]
+            records = record_type.records(unmarshalled)
+            del unmarshalled
+            compact = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        results[object_type] = {
+            'objects': len(records),
+            'dicts': dicts,
+            'records': compact,
+            'reduction': 100.0 * (dicts - compact) / dicts if dicts else 0.0
+        }
+    return results
+
+
+def benchmark_logging(uri, parameters, repeat):
+    """Import time with each log_items mode, the logs are written to /dev/null"""
+    logger = logging.getLogger('alignak.module.import-glpi')
+    handler = logging.FileHandler(os.devnull)
+    handler.setFormatter(logging.Formatter('[%(asctime)s] %(levelname)s: %(message)s'))
+    logger.addHandler(handler)
+    logger.propagate = False
+    results = {}
+    try:
+        for level in [logging.INFO, logging.DEBUG]:
+            logger.setLevel(level)
+            for log_items in ['all', 'sample']:
+                instance = get_instance(uri, dict(parameters, log_items=log_items))
+                instance.init()
+                fetched = instance._fetch_objects()
+                merged = []
+                for _ in range(repeat):
+                    start = time.time()
+                    instance._get_result(fetched)
+                    merged.append(time.time() - start)
+                results['%s_%s' % (logging.getLevelName(level).lower(), log_items)] = \
+                    min(merged)
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Compare the throughput with the baseline one
+
+    :return: True if the throughput is not lower than the baseline minus the tolerance
+    """
+    minimum = baseline['import']['throughput'] * (1 - tolerance / 100.0)
+    print("Throughput: %.0f objects/s, baseline: %.0f objects/s, minimum: %.0f objects/s"
+          % (results['import']['throughput'], baseline['import']['throughput'], minimum))
+    return results['import']['throughput'] >= minimum
+
+
+def main():
+    """Run the benchmarks"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entities', type=int, default=10, help="entities count")
+    parser.add_argument('--hosts', type=int, default=1000, help="hosts count per entity")
+    parser.add_argument('--services', type=int,
+                        help="services count per host, default is 1 or given by the hosts "
+                             "templates of the realistic configuration")
+    parser.add_argument('--payload', type=int, default=0,
+                        help="size of the notes property of the hosts and services")
+    parser.add_argument('--realistic', action='store_true',
+                        help="generate a realistic configuration (see glpi_dataset), "
+                             "--services is the mean services count per host")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="random generator seed of the realistic configuration")
+    parser.add_argument('--latency', type=float, default=0,
+                        help="duration of each fake Glpi request (seconds)")
+    parser.add_argument('--parameter', action='append', default=[],
+                        help="module parameter, as name=value")
+    parser.add_argument('--repeat', type=int, default=3, help="imports count")
+    parser.add_argument('--logging', action='store_true',
+                        help="benchmark the objects logs modes")
+    parser.add_argument('--records', action='store_true',
+                        help="benchmark the memory of the objects stored as compact records")
+    parser.add_argument('--output', help="save the results in this JSON file")
+    parser.add_argument('--baseline', help="compare with the results saved in this JSON file")
+    parser.add_argument('--tolerance', type=float, default=10,
+                        help="accepted throughput decrease from the baseline (percent)")
+    args = parser.parse_args()
+    parameters = dict(parameter.split('=', 1) for parameter in args.parameter)
+
+    queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(queue, args))
+    server.daemon = True
+    server.start()
+    try:
+        uri = queue.get(timeout=600)
+        print("%d entities, %d hosts per entity, %s services per host, payload: %d bytes, "
+              "latency: %.3f seconds, parameters: %s"
+              % (args.entities, args.hosts, args.services or 'default', args.payload,
+                 args.latency, parameters))
+        results = {
+            'dataset': {'entities': args.entities, 'hosts': args.hosts,
+                        'services': args.services, 'payload': args.payload,
+                        'realistic': args.realistic, 'seed': args.seed,
+                        'latency': args.latency},
+            'parameters': parameters,
+            'import': benchmark_import(uri, parameters, args.repeat),
+            'memory': benchmark_memory(uri, parameters)
+        }
+        if args.logging:
+            results['logging'] = benchmark_logging(uri, parameters, args.repeat)
+        if args.records:
+            results['records'] = benchmark_records(args)
+    finally:
+        server.terminate()
+
+    print(json.dumps(results, indent=2, sort_keys=True))
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+        if not compare(results, baseline, args.tolerance):
+            print("Performance regression!")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2019: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+A fake Glpi XML-RPC server to test the module without a real Glpi
+"""
+
+import gzip
+import json
+import time
+import threading
+from io import BytesIO
+
+try:
+    from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+    from socketserver import ThreadingMixIn
+
+try:
+    from xmlrpclib import Fault
+    from urlparse import urlparse, parse_qsl
+except ImportError:
+    from xmlrpc.client import Fault
+    from urllib.parse import urlparse, parse_qsl
+
+# Glpi monitoring WS methods and the object type they return
+WS_METHODS = {
+    'monitoring.getConfigCommands': 'command',
+    'monitoring.getConfigHosts': 'host',
+    'monitoring.getConfigHostgroups': 'hostgroup',
+    'monitoring.getConfigServicesTemplates': 'servicestemplate',
+    'monitoring.getConfigServices': 'service',
+    'monitoring.getConfigRealms': 'realm',
+    'monitoring.getConfigContacts': 'contact',
+    'monitoring.getConfigTimeperiods': 'timeperiod',
+}
+
+
+def make_data(entities=3, hosts=5, services=1, payload=0):
+    """Build a monitoring configuration for some entities
+
+    :param entities: entities count
+    :param hosts: hosts count per entity
+    :param services: services count per host
+    :param payload: size of the notes property of the hosts and services
+    :return: {entity: {object type: [items]}}
+    """
+    notes = {'notes': 'x' * payload} if payload else {}
+    data = {}
+    for entity_idx in range(entities):
+        entity = 'entity-%d' % entity_idx
+        data[entity] = {
+            'command': [{'command_name': 'check_ping',
+                         'command_line': '$PLUGINSDIR$/check_ping -H $HOSTADDRESS$'}],
+            'host': [dict({'host_name': '%s-host-%d' % (entity, idx),
+                           'address': '127.0.0.%d' % idx, 'check_command': 'check_ping'},
+                          **notes)
+                     for idx in range(hosts)],
+            'servicestemplate': [{'name': 'generic-service', 'register': '0'}],
+            'service': [dict({'host_name': '%s-host-%d' % (entity, idx),
+                              'service_description': 'service-%d' % service if service
+                              else 'ping',
+                              'use': 'generic-service'}, **notes)
+                        for idx in range(hosts) for service in range(services)],
+            'contact': [{'contact_name': 'admin'}],
+            'timeperiod': [{'timeperiod_name': '24x7'}],
+        }
+    return data
+
+
+class RequestHandler(SimpleXMLRPCRequestHandler):
+    """Accept requests on any path, like the Glpi xmlrpc.php endpoint"""
+    rpc_paths = ()
+    # Keep the connections alive
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        """XML-RPC requests"""
+        if not self.server.available(self):
+            return
+        SimpleXMLRPCRequestHandler.do_POST(self)
+
+    def do_GET(self):
+        """JSON requests, like the Glpi rest.php endpoint"""
+        if not self.server.available(self):
+            return
+        parameters = dict(parse_qsl(urlparse(self.path).query))
+        method = parameters.pop('method', '')
+        try:
+            response = self.server.funcs[method](parameters)
+        except KeyError:
+            response = {'faultCode': 1, 'faultString': 'Unknown method: %s' % method}
+        except Fault as exp:
+            response = {'faultCode': exp.faultCode, 'faultString': exp.faultString}
+        body = json.dumps(response).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            buf = BytesIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as gzip_file:
+                gzip_file.write(body)
+            body = buf.getvalue()
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ThreadedXMLRPCServer(ThreadingMixIn, SimpleXMLRPCServer):
+    """XML-RPC server handling each connection in its own thread"""
+    daemon_threads = True
+    # Accept many concurrent connections, like a web server
+    request_queue_size = 64
+    connections = 0
+    requests = 0
+    # Count of the next requests answered with a 503 error
+    unavailable = 0
+    _lock = threading.Lock()
+
+    def available(self, handler):
+        """Answer a request with a 503 error while the server is unavailable
+
+        :return: True if the request must be handled
+        """
+        with self._lock:
+            if self.unavailable <= 0:
+                return True
+            self.unavailable -= 1
+        handler.send_response(503)
+        handler.send_header('Content-Length', '0')
+        handler.send_header('Connection', 'close')
+        handler.end_headers()
+        handler.close_connection = True
+        return False
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        ThreadingMixIn.process_request(self, request, client_address)
+
+    def _marshaled_dispatch(self, data, *args, **kwargs):
+        self.requests += 1
+        return SimpleXMLRPCServer._marshaled_dispatch(self, data, *args, **kwargs)
+
+
+class FakeGlpi(object):
+    """
+    Serve the monitoring configuration of some entities as the Glpi WS plugin does
+
+    `data` is a dictionary: {entity: {object type: [items]}}
+
+    When the `since` parameter is provided, only the items which `date_mod` is more
+    recent are returned. The `start` and `limit` parameters select a page of items, unless
+    `paginate` is unset.
+
+    `delay` is the duration of each request, `delays` the duration of the requests of
+    some methods and `faults` is a list of the methods that raise an XML-RPC fault, to
+    simulate a slow or failing Glpi. The next `server.unavailable` requests are answered
+    with a 503 error.
+
+    Each login opens a new session, the requests of a session that is not opened raise a
+    "Not authenticated" fault. `expire_sessions` simulates the Glpi sessions expiry.
+
+    If `multicall` is set, the server provides the system.multicall method.
+    """
+
+    def __init__(self, data, session='fake-session', multicall=False):
+        self.data = data
+        self.session = session
+        self.delay = 0
+        self.delays = {}
+        self.faults = []
+        self.calls = []
+        self.sessions = set()
+        self.paginate = True
+        self.logins = 0
+        self.lock = threading.Lock()
+
+        self.server = ThreadedXMLRPCServer(('127.0.0.1', 0), requestHandler=RequestHandler,
+                                           logRequests=False, allow_none=True)
+        self.server.register_function(self.do_login, 'glpi.doLogin')
+        self.server.register_function(self.get_entities, 'monitoring.getMonitoredEntities')
+        for method, object_type in WS_METHODS.items():
+            self.server.register_function(self._make_ws(method, object_type), method)
+        if multicall:
+            self.server.register_multicall_functions()
+        self.thread = None
+
+    @property
+    def uri(self):
+        """Server XML-RPC endpoint"""
+        return 'http://%s:%d/glpi/plugins/webservices/xmlrpc.php' % self.server.server_address
+
+    @property
+    def json_uri(self):
+        """Server JSON endpoint"""
+        return 'http://%s:%d/glpi/plugins/webservices/rest.php' % self.server.server_address
+
+    def start(self):
+        """Serve in a background thread"""
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving"""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _record(self, method, parameters):
+        with self.lock:
+            self.calls.append((method, dict(parameters)))
+        delay = self.delays.get(method, self.delay)
+        if delay:
+            time.sleep(delay)
+        if method in self.faults:
+            raise Fault(1, "%s is not available" % method)
+        if method != 'glpi.doLogin' and parameters.get('session') not in self.sessions:
+            raise Fault(13, "Not authenticated")
+
+    def expire_sessions(self):
+        """Close all the opened sessions"""
+        with self.lock:
+            self.sessions.clear()
+
+    def do_login(self, parameters):
+        """glpi.doLogin"""
+        self._record('glpi.doLogin', parameters)
+        with self.lock:
+            self.logins += 1
+            session = '%s-%d' % (self.session, self.logins)
+            self.sessions.add(session)
+        return {'session': session}
+
+    def get_entities(self, parameters):
+        """monitoring.getMonitoredEntities"""
+        self._record('monitoring.getMonitoredEntities', parameters)
+        return sorted(self.data)
+
+    def _make_ws(self, method, object_type):
+        def get_config(parameters):
+            """monitoring.getConfig* methods"""
+            self._record(method, parameters)
+            entity = parameters.get('entity', '')
+            if entity:
+                items = self.data.get(entity, {}).get(object_type, [])
+            else:
+                items = []
+                for entity in sorted(self.data):
+                    items.extend(self.data[entity].get(object_type, []))
+            if 'since' in parameters:
+                items = [item for item in items
+                         if item.get('date_mod', '') >= parameters['since']]
+            if 'limit' in parameters and self.paginate:
+                start = int(parameters.get('start', 0))
+                items = items[start:start + int(parameters['limit'])]
+            return items
+        return get_config
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2019: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Generate a synthetic Glpi monitoring configuration for scale tests
+
+The configuration looks like the one of a real Glpi: the hosts and services use
+templates, the hosts are in host groups and realms, the services check commands and
+the contacts time periods are shared by the entities. The same seed always generates
+the same configuration.
+
+The configuration may be served by the fake Glpi or saved as a module snapshot.
+Run from the repository root directory:
+    python -m test.glpi_dataset --entities 100 --hosts 1000 --output dataset.json
+    python -m test.glpi_dataset --hosts 1000 --snapshot /tmp/cache --uri http://glpi/...
+    python -m test.glpi_dataset --hosts 1000 --serve
+"""
+
+import json
+import time
+import random
+import argparse
+
+from alignak_module_import_glpi.snapshot import GlpiSnapshot
+
+from .fake_glpi import FakeGlpi
+
+# Hosts templates: name, check command, services
+HOST_TEMPLATES = [
+    ('linux-host', 'check_ping',
+     ['cpu', 'memory', 'load', 'disk /', 'disk /var', 'ssh', 'ntp']),
+    ('windows-host', 'check_ping',
+     ['cpu', 'memory', 'disk C:', 'disk D:', 'rdp', 'services']),
+    ('network-device', 'check_snmp_ping',
+     ['interfaces', 'uptime', 'cpu', 'temperature']),
+    ('web-server', 'check_ping',
+     ['http', 'https', 'certificate', 'cpu', 'memory', 'disk /']),
+    ('database-server', 'check_ping',
+     ['mysql', 'mysql replication', 'cpu', 'memory', 'disk /', 'disk /var']),
+]
+
+# Services: check command and arguments
+SERVICE_CHECKS = {
+    'cpu': ('check_nrpe', 'check_cpu'),
+    'memory': ('check_nrpe', 'check_mem'),
+    'load': ('check_nrpe', 'check_load'),
+    'disk /': ('check_nrpe', 'check_disk!/'),
+    'disk /var': ('check_nrpe', 'check_disk!/var'),
+    'disk C:': ('check_nt', 'USEDDISKSPACE!C'),
+    'disk D:': ('check_nt', 'USEDDISKSPACE!D'),
+    'ssh': ('check_ssh', ''),
+    'ntp': ('check_ntp', ''),
+    'rdp': ('check_tcp', '3389'),
+    'services': ('check_nt', 'SERVICESTATE'),
+    'interfaces': ('check_snmp', 'ifOperStatus'),
+    'uptime': ('check_snmp', 'sysUpTime'),
+    'temperature': ('check_snmp', 'temperature'),
+    'http': ('check_http', ''),
+    'https': ('check_http', '--ssl'),
+    'certificate': ('check_http', '--ssl -C 30'),
+    'mysql': ('check_mysql', ''),
+    'mysql replication': ('check_mysql', '--check-slave'),
+}
+
+COMMANDS = sorted(set([command for command, _ in SERVICE_CHECKS.values()] +
+                      [command for _, command, _ in HOST_TEMPLATES]))
+
+TIMEPERIODS = [
+    {'timeperiod_name': '24x7', 'alias': 'Always',
+     'monday': '00:00-24:00', 'tuesday': '00:00-24:00', 'wednesday': '00:00-24:00',
+     'thursday': '00:00-24:00', 'friday': '00:00-24:00', 'saturday': '00:00-24:00',
+     'sunday': '00:00-24:00'},
+    {'timeperiod_name': 'workhours', 'alias': 'Working hours',
+     'monday': '08:00-18:00', 'tuesday': '08:00-18:00', 'wednesday': '08:00-18:00',
+     'thursday': '08:00-18:00', 'friday': '08:00-18:00'},
+]
+
+
+# Modification dates are in 2018
+DATE_MOD = 1514764800
+
+
+def _date(rng):
+    """Random modification date"""
+    return time.strftime('%Y-%m-%d %H:%M:%S',
+                         time.gmtime(DATE_MOD + rng.randint(0, 365 * 86400)))
+
+
+def generate(entities=10, hosts=1000, services=None, hosts_per_group=50, contacts=5,
+             seed=0):
+    """Generate the monitoring configuration of some entities
+
+    :param entities: entities count
+    :param hosts: hosts count per entity
+    :param services: mean services count per host, default is given by the hosts templates
+    :param hosts_per_group: mean hosts count per host group
+    :param contacts: contacts count per entity
+    :param seed: random generator seed
+    :return: {entity: {object type: [items]}}
+    """
+    rng = random.Random(seed)
+    data = {}
+    for entity_idx in range(entities):
+        entity = 'entity-%d' % entity_idx
+        realm = 'realm-%d' % entity_idx
+        groups = ['%s-group-%d' % (entity, idx)
+                  for idx in range(max(1, hosts // hosts_per_group))]
+        entity_contacts = ['%s-contact-%d' % (entity, idx) for idx in range(contacts)]
+
+        objects = {
+            'command': [{'command_name': name,
+                         'command_line': '$PLUGINSDIR$/%s -H $HOSTADDRESS$ $ARG1$' % name}
+                        for name in COMMANDS],
+            'timeperiod': [dict(timeperiod) for timeperiod in TIMEPERIODS],
+            'realm': [{'realm_name': realm, 'alias': 'Entity %d' % entity_idx,
+                       'default': '0'}],
+            'contact': [{'contact_name': 'admin', 'email': 'admin@example.com',
+                         'host_notification_period': '24x7',
+                         'service_notification_period': '24x7'}] +
+                       [{'contact_name': name, 'email': '%s@example.com' % name,
+                         'host_notification_period': rng.choice(['24x7', 'workhours']),
+                         'service_notification_period': 'workhours'}
+                        for name in entity_contacts],
+            'hostgroup': [{'hostgroup_name': name, 'alias': name.replace('-', ' ')}
+                          for name in groups],
+            'host': [{'name': 'generic-host', 'register': '0', 'check_period': '24x7',
+                      'notification_period': '24x7', 'max_check_attempts': '3'}] +
+                    [{'name': name, 'register': '0', 'use': 'generic-host',
+                      'check_command': command}
+                     for name, command, _ in HOST_TEMPLATES],
+            'servicestemplate': [{'name': 'generic-service', 'register': '0',
+                                  'check_period': '24x7', 'max_check_attempts': '3',
+                                  'check_interval': '5'}] +
+                                [{'name': 'service-%s' % command, 'register': '0',
+                                  'use': 'generic-service', 'check_command': command}
+                                 for command in sorted(set(command for command, _
+                                                           in SERVICE_CHECKS.values()))],
+            'service': [],
+        }
+
+        for idx in range(hosts):
+            template, _, checks = rng.choice(HOST_TEMPLATES)
+            host_name = '%s-host-%d' % (entity, idx)
+            objects['host'].append({
+                'host_name': host_name,
+                'alias': 'Host %d of %s' % (idx, entity),
+                'address': '10.%d.%d.%d' % (entity_idx % 256, idx // 256 % 256, idx % 256),
+                'use': template,
+                'hostgroups': ','.join(rng.sample(groups, min(len(groups),
+                                                              rng.randint(1, 2)))),
+                'realm': realm,
+                'contacts': ','.join(rng.sample(entity_contacts,
+                                                min(len(entity_contacts), 2))),
+                'date_mod': _date(rng)
+            })
+
+            names = checks
+            if services is not None:
+                count = rng.randint(max(1, services // 2), max(1, services * 3 // 2))
+                names = [checks[i % len(checks)] +
+                         (' %d' % (i // len(checks)) if i >= len(checks) else '')
+                         for i in range(count)]
+            for service_idx, name in enumerate(names):
+                command, arguments = SERVICE_CHECKS[checks[service_idx % len(checks)]]
+                objects['service'].append({
+                    'host_name': host_name,
+                    'service_description': name,
+                    'use': 'service-%s' % command,
+                    'check_command': '%s!%s' % (command, arguments) if arguments
+                                     else command,
+                    'date_mod': _date(rng)
+                })
+
+        data[entity] = objects
+    return data
+
+
+def save_snapshot(data, directory, uri, tag='', alignak_name=''):
+    """Save a configuration as the module snapshot
+
+    The module configured with the same uri, tag and alignak_name loads its
+    configuration from this snapshot rather than from Glpi.
+
+    :param data: configuration as returned by generate
+    :param directory: snapshot directory (cache_dir)
+    :return: snapshot file path
+    """
+    snapshot = GlpiSnapshot(directory, uri, tag, alignak_name)
+    now = time.time()
+    snapshot.save([(entity, data[entity], dict((object_type, now)
+                                               for object_type in data[entity]))
+                   for entity in sorted(data)], now)
+    return snapshot.path
+
+
+def main():
+    """Generate a configuration"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entities', type=int, default=10, help="entities count")
+    parser.add_argument('--hosts', type=int, default=1000, help="hosts count per entity")
+    parser.add_argument('--services', type=int, help="mean services count per host")
+    parser.add_argument('--seed', type=int, default=0, help="random generator seed")
+    parser.add_argument('--output', help="save the configuration in this JSON file")
+    parser.add_argument('--snapshot', help="save the configuration as a module snapshot "
+                                           "in this directory")
+    parser.add_argument('--uri', default='http://localhost/glpi/plugins/webservices/xmlrpc.php',
+                        help="Glpi uri of the snapshot")
+    parser.add_argument('--tag', default='', help="tag of the snapshot")
+    parser.add_argument('--alignak-name', default='', help="Alignak name of the snapshot")
+    parser.add_argument('--serve', action='store_true', help="serve with a fake Glpi")
+    args = parser.parse_args()
+
+    data = generate(args.entities, args.hosts, args.services, seed=args.seed)
+    counts = {}
+    for objects in data.values():
+        for object_type, items in objects.items():
+            counts[object_type] = counts.get(object_type, 0) + len(items)
+    print("Generated: %s" % ', '.join('%d %ss' % (counts[object_type], object_type)
+                                      for object_type in sorted(counts)))
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(data, fp)
+        print("Saved in %s" % args.output)
+    if args.snapshot:
+        print("Snapshot: %s" % save_snapshot(data, args.snapshot, args.uri, args.tag,
+                                             args.alignak_name))
+    if args.serve:
+        glpi = FakeGlpi(data, multicall=True)
+        print("Serving on %s and %s" % (glpi.uri, glpi.json_uri))
+        try:
+            glpi.server.serve_forever()
+        except KeyboardInterrupt:
+            glpi.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
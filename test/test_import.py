@@ -0,0 +1,794 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2019: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Test the configuration import from a (fake) Glpi
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+from .alignak_test import AlignakTest
+from .fake_glpi import FakeGlpi, make_data
+from .glpi_dataset import generate, save_snapshot
+from alignak.objects.module import Module
+
+import alignak_module_import_glpi
+from alignak_module_import_glpi.records import Record
+
+
+class StatsRecorder(object):
+    """Record the metrics sent to statsd"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def timer(self, key, value, *args):
+        self.metrics.append(('timer', key, value))
+
+    def counter(self, key, value, *args):
+        self.metrics.append(('counter', key, value))
+
+    def gauge(self, key, value, *args):
+        self.metrics.append(('gauge', key, value))
+
+    def total(self, key):
+        """Sum of the values of a metric"""
+        return sum(value for _, name, value in self.metrics if name == key)
+
+
+class TestImport(AlignakTest):
+    """
+    This class contains the tests for the configuration import
+    """
+
+    def setUp(self):
+        super(TestImport, self).setUp()
+        self.glpi = FakeGlpi(make_data()).start()
+
+    def tearDown(self):
+        self.glpi.stop()
+        super(TestImport, self).tearDown()
+
+    def get_instance(self, initialize=True, **parameters):
+        """Get a module instance connected to the fake Glpi, initialized if requested"""
+        configuration = {
+            'module_alias': 'import-glpi',
+            'module_types': 'configuration',
+            'python_name': 'alignak_module_import_glpi',
+            'uri': self.glpi.uri,
+            'entities': 'entity-0,entity-1,entity-2'
+        }
+        configuration.update(parameters)
+        instance = alignak_module_import_glpi.get_instance(Module(configuration))
+        if initialize:
+            self.assertTrue(instance.init())
+        return instance
+
+    def wait_for(self, condition, timeout=10):
+        """Wait until a condition is true"""
+        end = time.time() + timeout
+        while not condition():
+            self.assertLess(time.time(), end, "Condition not met in %d seconds" % timeout)
+            time.sleep(0.1)
+
+    def test_import(self):
+        """Import the configuration of several entities
+        :return:
+        """
+        objects = self.get_instance().get_objects()
+
+        self.assertEqual(len(objects['hosts']), 15)
+        # The services templates are returned with the services
+        self.assertEqual(len(objects['services']), 16)
+        self.assertEqual(objects['services'][0], {'name': 'generic-service', 'register': '0'})
+        # Duplicate objects are removed
+        self.assertEqual(len(objects['commands']), 1)
+        self.assertEqual(len(objects['contacts']), 1)
+        self.assertEqual(len(objects['timeperiods']), 1)
+
+    def test_import_workers(self):
+        """Import with several workers provides the same configuration
+        :return:
+        """
+        sequential = self.get_instance().get_objects()
+        concurrent = self.get_instance(max_workers='3').get_objects()
+
+        self.assertEqual(sequential, concurrent)
+
+    def test_import_concurrent_calls(self):
+        """Requesting the web services concurrently provides the same configuration
+        :return:
+        """
+        sequential = self.get_instance().get_objects()
+        concurrent = self.get_instance(concurrent_calls='1', max_workers='2').get_objects()
+
+        self.assertEqual(sequential, concurrent)
+
+    def test_import_snapshot(self):
+        """The configuration is loaded from the snapshot while it is not expired
+        :return:
+        """
+        cache_dir = tempfile.mkdtemp()
+        try:
+            imported = self.get_instance(cache_dir=cache_dir).get_objects()
+            calls = len(self.glpi.calls)
+
+            cached = self.get_instance(cache_dir=cache_dir).get_objects()
+            self.assertEqual(imported, cached)
+            # Only the login request
+            self.assertEqual(len(self.glpi.calls), calls + 1)
+
+            # Expired snapshot
+            self.get_instance(cache_dir=cache_dir, cache_ttl='0').get_objects()
+            self.assertGreater(len(self.glpi.calls), calls + 1)
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_import_fallback(self):
+        """The last snapshot is used when Glpi is not available
+        :return:
+        """
+        cache_dir = tempfile.mkdtemp()
+        try:
+            imported = self.get_instance(cache_dir=cache_dir).get_objects()
+
+            # Some requests fail
+            self.glpi.faults = ['monitoring.getConfigHosts']
+            objects = self.get_instance(cache_dir=cache_dir, cache_ttl='0').get_objects()
+            self.assertEqual(imported, objects)
+
+            # Glpi is too slow
+            self.glpi.faults = []
+            instance = self.get_instance(cache_dir=cache_dir, cache_ttl='0', fetch_deadline='1')
+            self.glpi.delays = {'monitoring.getConfigHosts': 0.8}
+            calls = len(self.glpi.calls)
+            start = time.time()
+            objects = instance.get_objects()
+            self.assertLess(time.time() - start, 2)
+            self.assertEqual(imported, objects)
+
+            # No other import starts while the import goes on in the background
+            start = time.time()
+            objects = instance.get_objects()
+            self.assertLess(time.time() - start, 0.5)
+            self.assertEqual(imported, objects)
+            instance._background.wait()
+            self.assertEqual(len([method for method, _ in self.glpi.calls[calls:]
+                                  if method == 'monitoring.getConfigHosts']), 3)
+        finally:
+            self.glpi.delays = {}
+            shutil.rmtree(cache_dir)
+
+    def test_import_timeouts(self):
+        """The timed out requests are abandoned and reported
+        :return:
+        """
+        imported = self.get_instance().get_objects()
+        self.glpi.delays = {'monitoring.getConfigServices': 1}
+
+        # Read timeout of an object type
+        instance = self.get_instance(ws_service_timeout='0.2', max_workers='3')
+        objects = instance.get_objects()
+        self.assertEqual(objects['hosts'], imported['hosts'])
+        # Only the services template
+        self.assertEqual(len(objects['services']), 1)
+        self.assertEqual(sorted(instance.timeouts),
+                         [('entity-0', 'service'), ('entity-1', 'service'),
+                          ('entity-2', 'service')])
+
+        # Import deadline, the requests are not sent once the deadline is reached
+        instance = self.get_instance(import_deadline='1', backend='json')
+        self.glpi.delays = {'monitoring.getConfigHosts': 3}
+        start = time.time()
+        objects = instance.get_objects()
+        self.assertLess(time.time() - start, 2)
+        self.assertEqual(objects['hosts'], [])
+        self.assertEqual(len(instance.timeouts), 23)
+        self.assertIn('entity-1: command, host', instance._timeouts_report())
+
+        # The objects are provided from the snapshot
+        cache_dir = tempfile.mkdtemp()
+        try:
+            self.glpi.delays = {}
+            self.get_instance(cache_dir=cache_dir).get_objects()
+            self.glpi.delays = {'monitoring.getConfigHosts': 3}
+            objects = self.get_instance(cache_dir=cache_dir, cache_ttl='0',
+                                        import_deadline='1').get_objects()
+            self.assertEqual(imported, objects)
+        finally:
+            self.glpi.delays = {}
+            shutil.rmtree(cache_dir)
+
+        # The connection timeout does not apply to the responses
+        self.glpi.delays = {'monitoring.getConfigHosts': 1}
+        try:
+            for backend in ('xmlrpc', 'json'):
+                instance = self.get_instance(connect_timeout='0.3', backend=backend)
+                self.assertEqual(instance.get_objects(), imported)
+                self.assertEqual(instance.timeouts, [])
+        finally:
+            self.glpi.delays = {}
+
+    def test_import_retries(self):
+        """The requests failing on transient errors are retried, a failing Glpi is not
+        requested anymore
+        :return:
+        """
+        imported = self.get_instance().get_objects()
+
+        for backend in ['xmlrpc', 'json']:
+            instance = self.get_instance(backend=backend, retry_backoff='0.05')
+            instance.statsmgr = stats = StatsRecorder()
+            self.glpi.server.unavailable = 2
+            self.assertEqual(imported, instance.get_objects())
+            self.assertEqual(stats.total('glpi.entity-0.command.retries'), 2)
+
+        # Glpi is not available, the requests are suspended after 3 failures
+        instance = self.get_instance(retry_backoff='0.01', circuit_threshold='3',
+                                     circuit_reset='0.5')
+        self.glpi.server.unavailable = 100
+        objects = instance.get_objects()
+        self.assertEqual(objects['hosts'], [])
+        self.assertEqual(self.glpi.server.unavailable, 97)
+        self.assertEqual(instance.breaker.state, 'open')
+
+        # Glpi is probed after the reset timeout
+        self.glpi.server.unavailable = 0
+        time.sleep(0.5)
+        self.assertEqual(imported, instance.get_objects())
+        self.assertEqual(instance.breaker.state, 'closed')
+
+    def test_import_session(self):
+        """A new session is opened when the session expires, the session is stored to be
+        reused by the next module instance
+        :return:
+        """
+        imported = self.get_instance().get_objects()
+
+        for parameters in [{'max_workers': '3', 'concurrent_calls': '1'},
+                           {'multicall': '1'}]:
+            instance = self.get_instance(**parameters)
+            instance.statsmgr = stats = StatsRecorder()
+            logins = self.glpi.logins
+            self.glpi.expire_sessions()
+            self.assertEqual(imported, instance.get_objects())
+            # Only one new session for the concurrent requests
+            self.assertEqual(self.glpi.logins, logins + 1)
+            self.assertEqual(stats.total('glpi.session.expired'), 1)
+
+        cache_dir = tempfile.mkdtemp()
+        session_file = os.path.join(cache_dir, 'session.json')
+        try:
+            instance = self.get_instance(session_file=session_file)
+            logins = self.glpi.logins
+            reused = self.get_instance(session_file=session_file)
+            self.assertEqual(reused.session, instance.session)
+            self.assertEqual(self.glpi.logins, logins)
+            self.assertEqual(imported, reused.get_objects())
+
+            # Not reused for another login or after the session ttl
+            self.assertNotEqual(self.get_instance(session_file=session_file,
+                                                  login_name='other').session,
+                                instance.session)
+            self.assertNotEqual(self.get_instance(session_file=session_file,
+                                                  session_ttl='0').session,
+                                instance.session)
+
+            # The stored session was closed by Glpi
+            session = self.get_instance(session_file=session_file).session
+            self.glpi.expire_sessions()
+            reused = self.get_instance(session_file=session_file)
+            self.assertEqual(reused.session, session)
+            self.assertEqual(imported, reused.get_objects())
+            self.assertNotEqual(reused.session, session)
+            self.assertEqual(self.get_instance(session_file=session_file).session,
+                             reused.session)
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_import_incremental(self):
+        """Only the modified objects are requested and patched into the snapshot
+        :return:
+        """
+        cache_dir = tempfile.mkdtemp()
+        try:
+            self.get_instance(cache_dir=cache_dir).get_objects()
+
+            hosts = self.glpi.data['entity-0']['host']
+            hosts[0] = dict(hosts[0], address='10.0.0.1', date_mod='2100-01-01 00:00:00')
+            hosts.append({'host_name': 'new-host', 'address': '10.0.0.2',
+                          'date_mod': '2100-01-01 00:00:00'})
+            self.glpi.calls = []
+
+            objects = self.get_instance(cache_dir=cache_dir, cache_ttl='0',
+                                        incremental='1').get_objects()
+            self.assertEqual(len(objects['hosts']), 16)
+            self.assertEqual(objects['hosts'][0]['address'], '10.0.0.1')
+            self.assertEqual(objects['hosts'][5]['host_name'], 'new-host')
+            self.assertEqual(len(objects['services']), 16)
+            for method, parameters in self.glpi.calls:
+                if method.startswith('monitoring.getConfig'):
+                    self.assertIn('since', parameters)
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_import_duplicates(self):
+        """Objects with the same name in several entities
+        :return:
+        """
+        self.glpi.data['entity-1']['command'] = [
+            {'command_name': 'check_ping', 'command_line': 'check_ping -H $HOSTADDRESS$ -4',
+             'timeout': '10'}
+        ]
+        self.glpi.data['entity-2']['command'] = []
+
+        objects = self.get_instance().get_objects()
+        self.assertEqual(objects['commands'], self.glpi.data['entity-0']['command'])
+
+        objects = self.get_instance(duplicates='last').get_objects()
+        self.assertEqual(objects['commands'], self.glpi.data['entity-1']['command'])
+
+        objects = self.get_instance(duplicates='merge').get_objects()
+        self.assertEqual(objects['commands'], self.glpi.data['entity-1']['command'])
+        self.glpi.data['entity-1']['command'][0].pop('command_line')
+        objects = self.get_instance(duplicates='merge').get_objects()
+        self.assertEqual(objects['commands'], [
+            {'command_name': 'check_ping',
+             'command_line': '$PLUGINSDIR$/check_ping -H $HOSTADDRESS$', 'timeout': '10'}
+        ])
+
+        # A template is not a duplicate of the object with the same name
+        template = {'name': 'entity-0-host-0', 'register': '0'}
+        self.glpi.data['entity-0']['host'].append(template)
+        objects = self.get_instance().get_objects()
+        self.assertEqual(len(objects['hosts']), 16)
+        self.assertIn(template, objects['hosts'])
+
+        # The services of the hostgroups are not named by their description only
+        services = [{'hostgroup_name': 'group-%d' % idx, 'service_description': 'ping',
+                     'check_command': 'check_ping'} for idx in range(2)]
+        self.glpi.data['entity-0']['service'].extend(services)
+        self.glpi.data['entity-1']['service'].append(dict(services[0]))
+        objects = self.get_instance().get_objects()
+        self.assertEqual(len(objects['services']), 18)
+        for service in services:
+            self.assertIn(service, objects['services'])
+
+    def test_import_records(self):
+        """The imported objects are stored as compact records, the arbiter gets dictionaries
+        :return:
+        """
+        imported = self.get_instance().get_objects()
+
+        for parameters in [{}, {'multicall': '1'}]:
+            instance = self.get_instance(**parameters)
+            fetched = instance._fetch_objects()
+            services = [item for _, objects in fetched
+                        for ws, items in objects if ws['type'] == 'service' for item in items]
+            self.assertEqual(len(services), 15)
+            self.assertTrue(all(isinstance(item, Record) for item in services))
+            # The services share their keys and their equal values
+            self.assertEqual(len(set(id(item._layout) for item in services)), 1)
+            self.assertEqual(len(set(id(item['use']) for item in services)), 1)
+
+            objects = instance._get_result(fetched)
+            self.assertEqual(imported, objects)
+            self.assertTrue(all(type(item) is dict
+                                for items in objects.values() for item in items))
+
+    def test_import_pages(self):
+        """Paginated requests provide the same configuration
+        :return:
+        """
+        imported = self.get_instance().get_objects()
+
+        for prefetch in ['1', '3']:
+            self.glpi.calls = []
+            paginated = self.get_instance(ws_host_page_size='2', ws_service_page_size='5',
+                                          page_prefetch=prefetch).get_objects()
+            self.assertEqual(imported, paginated)
+            limits = [parameters['limit'] for method, parameters in self.glpi.calls
+                      if method == 'monitoring.getConfigHosts']
+            self.assertGreaterEqual(len(limits), 9)
+            self.assertEqual(set(limits), set([2]))
+
+        # Glpi does not paginate: the first page has all the objects, the next pages are
+        # not requested
+        self.glpi.paginate = False
+        engines = ['threads', 'asyncio'] if sys.version_info >= (3, 5) else ['threads']
+        for engine, prefetch in [(engine, prefetch) for engine in engines
+                                 for prefetch in ['1', '3']]:
+            self.glpi.calls = []
+            objects = self.get_instance(ws_host_page_size='2', ws_service_page_size='5',
+                                        page_prefetch=prefetch, engine=engine).get_objects()
+            self.assertEqual(imported, objects)
+            calls = [method for method, _ in self.glpi.calls
+                     if method in ['monitoring.getConfigHosts', 'monitoring.getConfigServices']]
+            # Per entity: the hosts first pages, the services first pages and the page
+            # repeating the first one
+            self.assertLessEqual(len(calls), 3 * (2 * int(prefetch) + 1))
+
+    def test_import_connections(self):
+        """The connections are kept alive and reused
+        :return:
+        """
+        # At most 2 entities x 8 web services are requested concurrently, the pool keeps
+        # all the connections
+        instance = self.get_instance(max_workers='2', concurrent_calls='1', pool_size='16')
+        instance.get_objects()
+        opened = self.glpi.server.connections
+        self.assertLessEqual(opened, 16)
+
+        # The 24 requests of the next import reuse the pool connections, a connection is
+        # only opened if more requests are concurrent than during the first import
+        instance.get_objects()
+        self.assertLessEqual(self.glpi.server.connections - opened, 16 - opened)
+
+        # The sequential requests of the next import only use the opened connection
+        instance = self.get_instance()
+        instance.get_objects()
+        opened = self.glpi.server.connections
+        instance.get_objects()
+        self.assertEqual(self.glpi.server.connections, opened)
+
+    def test_import_compression(self):
+        """Compressed responses provide the same configuration
+        :return:
+        """
+        instance = self.get_instance(gzip='0')
+        imported = instance.get_objects()
+        received, decoded, _ = instance.transferred
+        self.assertEqual(received, decoded)
+
+        instance = self.get_instance(gzip='1', gzip_request_threshold='10')
+        compressed = instance.get_objects()
+        self.assertEqual(imported, compressed)
+        self.assertLess(instance.transferred[0], received)
+        self.assertEqual(instance.transferred[1], decoded)
+
+    def test_import_json(self):
+        """The JSON backend provides the same configuration
+        :return:
+        """
+        imported = self.get_instance().get_objects()
+
+        for gzip in ['0', '1']:
+            instance = self.get_instance(backend='json', gzip=gzip, max_workers='3')
+            self.assertEqual(instance.backend.uri, self.glpi.json_uri)
+            self.assertEqual(imported, instance.get_objects())
+
+        self.glpi.faults = ['monitoring.getConfigHosts']
+        objects = self.get_instance(backend='json').get_objects()
+        self.assertEqual(objects['hosts'], [])
+
+    def test_import_multicall(self):
+        """Multicall requests provide the same configuration
+        :return:
+        """
+        imported = self.get_instance().get_objects()
+        requests = self.glpi.server.requests
+
+        # system.multicall is not available
+        instance = self.get_instance(multicall='1')
+        self.assertEqual(imported, instance.get_objects())
+        self.assertFalse(instance.multicall)
+
+        self.glpi.stop()
+        self.glpi = FakeGlpi(make_data(), multicall=True).start()
+        for workers in ['1', '3']:
+            instance = self.get_instance(multicall='1', multicall_size='8',
+                                         max_workers=workers)
+            self.assertEqual(imported, instance.get_objects())
+            # 1 login and 3 multicall requests rather than 24 requests
+            self.assertEqual(self.glpi.server.requests, 4)
+            self.glpi.server.requests = 0
+        self.assertGreater(requests, 4)
+
+        # Paginated web services are requested on their own
+        objects = self.get_instance(multicall='1', ws_host_page_size='2').get_objects()
+        self.assertEqual(imported, objects)
+
+        # Faults are raised per web service
+        self.glpi.faults = ['monitoring.getConfigHosts']
+        objects = self.get_instance(multicall='1').get_objects()
+        self.assertEqual(objects['hosts'], [])
+        self.assertEqual(len(objects['services']), 16)
+
+    @unittest.skipIf(sys.version_info < (3, 5), "asyncio engine requires Python 3.5")
+    def test_import_async(self):
+        """The asyncio engine provides the same configuration
+        :return:
+        """
+        imported = self.get_instance().get_objects()
+        for backend in ['xmlrpc', 'json']:
+            for gzip in ['0', '1']:
+                instance = self.get_instance(engine='asyncio', async_concurrency='4',
+                                             backend=backend, gzip=gzip)
+                self.assertEqual(instance.engine, 'asyncio')
+                self.assertEqual(imported, instance.get_objects())
+                # The event loop is closed at the end of the import and created again
+                self.assertIsNone(instance.backend.loop)
+                self.assertEqual(imported, instance.get_objects())
+
+        # Paginated web services
+        objects = self.get_instance(engine='asyncio', ws_host_page_size='2').get_objects()
+        self.assertEqual(imported, objects)
+
+        # Faults are raised per web service
+        self.glpi.faults = ['monitoring.getConfigHosts']
+        objects = self.get_instance(engine='asyncio').get_objects()
+        self.assertEqual(objects['hosts'], [])
+        self.assertEqual(len(objects['services']), 16)
+
+        self.assertEqual(self.get_instance(engine='unknown').engine, 'threads')
+
+    def test_import_external(self):
+        """The external module process refreshes the snapshot loaded by the arbiter
+        :return:
+        """
+        self.assertFalse(self.get_instance(external='1').is_external)
+
+        cache_dir = tempfile.mkdtemp()
+        try:
+            imported = self.get_instance().get_objects()
+            instance = self.get_instance(cache_dir=cache_dir, external='1',
+                                         refresh_period='3600')
+            self.assertTrue(instance.is_external)
+
+            # The module process loop refreshes the snapshot at once, with its own
+            # connections
+            opened = self.glpi.server.connections
+            loop = threading.Thread(target=instance.main)
+            loop.daemon = True
+            loop.start()
+            self.wait_for(lambda: os.path.exists(instance.snapshot.path))
+            self.assertGreater(self.glpi.server.connections, opened)
+            self.glpi.data['entity-0']['host'].pop()
+            self.glpi.calls = []
+            # Loaded from the snapshot, whatever its age
+            self.assertEqual(imported, self.get_instance(
+                cache_dir=cache_dir, cache_ttl='0', external='1').get_objects())
+            self.assertEqual([method for method, _ in self.glpi.calls], ['glpi.doLogin'])
+
+            # Not refreshed before the refresh period
+            self.assertEqual(imported, instance.get_objects())
+
+            # The loop stops while waiting for the next refresh
+            instance.interrupted = True
+            loop.join(5)
+            self.assertFalse(loop.is_alive())
+
+            instance.interrupted = False
+            instance._refreshed = 0
+            loop = threading.Thread(target=instance.main)
+            loop.daemon = True
+            loop.start()
+            try:
+                self.wait_for(lambda: len(instance.get_objects()['hosts']) == 14)
+            finally:
+                instance.interrupted = True
+                loop.join(5)
+        finally:
+            shutil.rmtree(cache_dir)
+
+        # The arbiter gets its configuration before the module is initialized, Glpi is
+        # requested if no snapshot is prepared yet
+        cache_dir = tempfile.mkdtemp()
+        try:
+            instance = self.get_instance(initialize=False, cache_dir=cache_dir, external='1')
+            self.assertEqual(len(instance.get_objects()['hosts']), 14)
+            self.assertTrue(instance.session)
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_import_changes(self):
+        """The configuration changes are detected
+        :return:
+        """
+        # Not detected by default
+        instance = self.get_instance()
+        instance.get_objects()
+        self.assertIsNone(instance.changed)
+
+        instance = self.get_instance(change_detection='1')
+        instance.statsmgr = stats = StatsRecorder()
+        instance.get_objects()
+        self.assertTrue(instance.changed)
+        self.assertIn(('gauge', 'glpi.changed', 1), stats.metrics)
+
+        # Objects order and volatile properties do not change the configuration
+        self.glpi.data['entity-0']['host'].reverse()
+        self.glpi.data['entity-1']['host'][0]['date_mod'] = '2100-01-01 00:00:00'
+        instance.get_objects()
+        self.assertFalse(instance.changed)
+        self.assertFalse(instance.changes['host']['changed'])
+        self.assertEqual(stats.metrics[-1], ('gauge', 'glpi.changed', 0))
+
+        self.glpi.data['entity-1']['host'][0]['address'] = '10.0.0.1'
+        self.glpi.data['entity-2']['host'].pop()
+        instance.get_objects()
+        self.assertTrue(instance.changed)
+        self.assertEqual(instance.changes['host'], {
+            'changed': True, 'entities': ['entity-1', 'entity-2'],
+            'count': 14, 'previous_count': 15
+        })
+        self.assertFalse(instance.changes['service']['changed'])
+
+        # Compared with the snapshot when the module starts, with the stored hashes
+        cache_dir = tempfile.mkdtemp()
+        try:
+            self.get_instance(cache_dir=cache_dir, change_detection='1').get_objects()
+            instance = self.get_instance(cache_dir=cache_dir, cache_ttl='0',
+                                         change_detection='1')
+            instance.get_objects()
+            self.assertFalse(instance.changed)
+            with open(instance.changes_file) as fp:
+                changes = json.load(fp)
+            self.assertFalse(changes['changed'])
+            self.assertEqual(changes['changes']['host']['count'], 14)
+            self.assertEqual(os.path.dirname(instance.changes_file), cache_dir)
+
+            # The first configuration provided from the snapshot is changed
+            for parameters in [{'cache_ttl': '3600'}, {'external': '1'}]:
+                instance = self.get_instance(cache_dir=cache_dir, change_detection='1',
+                                             **parameters)
+                instance.get_objects()
+                self.assertTrue(instance.changed)
+                instance.get_objects()
+                self.assertFalse(instance.changed)
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_import_diff(self):
+        """The changes between two imports are reported
+        :return:
+        """
+        report_dir = tempfile.mkdtemp()
+        report = os.path.join(report_dir, 'changes.json')
+        try:
+            instance = self.get_instance(diff_report=report)
+            instance.get_objects()
+            self.assertFalse(os.path.exists(report))
+
+            hosts = self.glpi.data['entity-1']['host']
+            hosts[0]['address'] = '10.0.0.1'
+            hosts[0]['date_mod'] = '2100-01-01 00:00:00'
+            hosts.append({'host_name': 'new-host', 'address': '10.0.0.2'})
+            self.glpi.data['entity-2']['service'].pop()
+            instance.get_objects()
+            with open(report) as fp:
+                changes = json.load(fp)
+            self.assertTrue(changes['changed'])
+            self.assertEqual(changes['summary'], {
+                'hosts': {'added': 1, 'removed': 0, 'modified': 1},
+                'services': {'added': 0, 'removed': 1, 'modified': 0}
+            })
+            self.assertEqual(changes['objects']['hosts'], {
+                'added': ['new-host'], 'removed': [],
+                'modified': [{'name': 'entity-1-host-0',
+                              'changes': {'address': ['127.0.0.0', '10.0.0.1']}}]
+            })
+            self.assertEqual(changes['objects']['services']['removed'], ['entity-2-host-4/ping'])
+
+            instance.get_objects()
+            with open(report) as fp:
+                changes = json.load(fp)
+            self.assertFalse(changes['changed'])
+            self.assertEqual(changes['objects'], {})
+        finally:
+            shutil.rmtree(report_dir)
+
+    def test_import_log_items(self):
+        """The objects logs do not change the configuration
+        :return:
+        """
+        imported = self.get_instance().get_objects()
+        self.assertEqual(imported, self.get_instance(log_items='all').get_objects())
+        self.assertEqual(imported, self.get_instance(log_items='sample',
+                                                     log_sample='0').get_objects())
+
+    def test_import_metrics(self):
+        """Metrics are sent for each web service call
+        :return:
+        """
+        for parameters in [{}, {'ws_host_page_size': '2'}, {'multicall': '1'}]:
+            instance = self.get_instance(**parameters)
+            instance.statsmgr = stats = StatsRecorder()
+            self.glpi.faults = ['monitoring.getConfigContacts']
+            instance.get_objects()
+            self.glpi.faults = []
+
+            self.assertEqual(stats.total('glpi.entity-0.host.items'), 5)
+            self.assertEqual(stats.total('glpi.entity-1.service.items'), 5)
+            self.assertEqual(stats.total('glpi.entity-2.contact.errors'), 1)
+            self.assertEqual(stats.total('glpi.import') > 0, True)
+            self.assertEqual(stats.total('glpi.entities.count'), 3)
+            received = sum(value for _, name, value in stats.metrics
+                           if name.endswith('.bytes'))
+            self.assertEqual(received, stats.total('glpi.received'))
+
+        instance = self.get_instance()
+        instance.statsmgr = stats = StatsRecorder()
+        instance.get_objects()
+        self.assertEqual(len([name for _, name, _ in stats.metrics
+                              if name.endswith('.host.time')]), 3)
+
+    def test_import_profile(self):
+        """The import profile report is written
+        :return:
+        """
+        report_dir = tempfile.mkdtemp()
+        report = os.path.join(report_dir, 'profile')
+        try:
+            imported = self.get_instance().get_objects()
+            instance = self.get_instance(profile='1', profile_report=report)
+            self.assertEqual(imported, instance.get_objects())
+
+            with open(report + '.json') as fp:
+                profile = json.load(fp)
+            self.assertEqual(profile, instance.last_profile)
+            for category in ['network', 'unmarshalling', 'deduplication', 'assembly']:
+                self.assertIn(category, profile['categories'])
+            self.assertEqual(profile['categories']['network']['calls'], 24)
+            with open(report + '.txt') as fp:
+                self.assertIn('- network', fp.read())
+
+            os.environ['ALIGNAK_GLPI_PROFILE'] = report + '-env'
+            try:
+                self.get_instance().get_objects()
+            finally:
+                del os.environ['ALIGNAK_GLPI_PROFILE']
+            self.assertTrue(os.path.exists(report + '-env.json'))
+        finally:
+            shutil.rmtree(report_dir)
+
+    def test_import_dataset(self):
+        """Import a generated configuration, from Glpi and from a snapshot
+        :return:
+        """
+        data = generate(entities=3, hosts=100, seed=1)
+        self.assertEqual(data, generate(entities=3, hosts=100, seed=1))
+        self.glpi.stop()
+        self.glpi = FakeGlpi(data).start()
+
+        objects = self.get_instance().get_objects()
+        # 6 hosts templates per entity, shared by the entities
+        self.assertEqual(len(objects['hosts']), 306)
+        self.assertEqual(len(objects['commands']), len(data['entity-0']['command']))
+        self.assertEqual(len(objects['realms']), 3)
+        self.assertEqual(len(objects['services']),
+                         sum(len(data[entity]['service']) + len(data[entity]['servicestemplate'])
+                             for entity in data) - 2 * len(data['entity-0']['servicestemplate']))
+
+        cache_dir = tempfile.mkdtemp()
+        try:
+            save_snapshot(data, cache_dir, self.glpi.uri)
+            self.glpi.calls = []
+            self.assertEqual(objects, self.get_instance(cache_dir=cache_dir).get_objects())
+            self.assertEqual([method for method, _ in self.glpi.calls], ['glpi.doLogin'])
+        finally:
+            shutil.rmtree(cache_dir)